@@ -1,11 +1,24 @@
+import array
+import asyncio
+import bisect
+import codecs
 import collections
+import concurrent.futures
 import datetime
 import fnmatch
+import functools
+import gc
 import glob
 import io
+import itertools
+import mmap
+import multiprocessing
 import os
 import random
 import re
+import struct
+import sys
+import tempfile
 import time
 
 import math
@@ -82,6 +95,22 @@ UNICODE_SPACES = {
     '\ufeff',  # zero width non-breaking space (also byte order mark)
 }
 
+UNICODE_QUOTES = {
+    '\u2018': "'",  # left single quote
+    '\u2019': "'",  # right single quote (also used as apostrophe)
+    '\u201a': "'",  # single low-9 quote
+    '\u201b': "'",  # single high-reversed-9 quote
+    '\u2032': "'",  # prime
+    '\u201c': '"',  # left double quote
+    '\u201d': '"',  # right double quote
+    '\u201e': '"',  # double low-9 quote
+    '\u201f': '"',  # double high-reversed-9 quote
+    '\u2033': '"',  # double prime
+}
+
+# unicode spaces become ' ' and curly quotes become straight quotes
+_FOLD_UNICODE_TABLE = str.maketrans(dict([(char, ' ') for char in UNICODE_SPACES] + list(UNICODE_QUOTES.items())))
+
 
 def crawl(top='.', pattern='*'):
     for potential_path in glob.glob(os.path.abspath(top)):
@@ -136,14 +165,41 @@ def format_seconds(num):
     return ('%.2f %s' if num % 1 else '%d %s') % (num, unit[:-1] if num == 1 else unit)
 
 
+@functools.lru_cache(maxsize=65536)
+def fold_case(token):
+    """
+    token folding for case-insensitive tries (see AhoCorasickReplace's `fold`)
+    :type token: str
+    :rtype: str
+    """
+    return token.casefold()
+
+
+@functools.lru_cache(maxsize=65536)
+def fold_unicode(token):
+    """
+    like fold_case, but also folds UNICODE_SPACES to ' ' and UNICODE_QUOTES to straight quotes
+    :type token: str
+    :rtype: str
+    """
+    return token.translate(_FOLD_UNICODE_TABLE).casefold()
+
+
 def char_group_tokenize(text, token_max_len=65535):
     """
     unused function
     tokenizes alphabet, numbers, and other unicode separately
     about 10% slower than the simpler tokenizer
+    strings are tokenized with a precompiled regex, any other iterable of chars one char at a time (same output)
     :param text:
     :param token_max_len:
     """
+    if type(text) is str and token_max_len >= 1:
+        return _regex_tokenize(_tokenizer_regex('char_group'), text, token_max_len)
+    return _char_group_tokenize_chars(text, token_max_len)
+
+
+def _char_group_tokenize_chars(text, token_max_len=65535):
     # character classes
     punctuation = PUNCTUATION | UNPRINTABLE_CHARS
     spaces = UNICODE_SPACES
@@ -229,11 +285,18 @@ def char_group_tokenize(text, token_max_len=65535):
 def space_tokenize(text, token_max_len=65535, emit_space=True, emit_punc=True):
     """
     tokenize by whitespace (and punctuation)
+    strings are tokenized with a precompiled regex, any other iterable of chars one char at a time (same output)
     :param text: to be split
     :param token_max_len: truncate tokens after this length
     :param emit_space: emit spaces
     :param emit_punc: emit punctuation
     """
+    if type(text) is str and token_max_len >= 1:
+        return _regex_tokenize(_tokenizer_regex('space', emit_space, emit_punc), text, token_max_len)
+    return _space_tokenize_chars(text, token_max_len, emit_space, emit_punc)
+
+
+def _space_tokenize_chars(text, token_max_len=65535, emit_space=True, emit_punc=True):
     # character classes
     punctuation = PUNCTUATION | UNPRINTABLE_CHARS
     spaces = UNICODE_SPACES
@@ -282,6 +345,141 @@ def space_tokenize(text, token_max_len=65535, emit_space=True, emit_punc=True):
         yield temp
 
 
+# precompiled regexes for tokenizing strings, {(tokenizer, emit_space, emit_punc): compiled regex}
+_TOKENIZER_REGEXES = dict()
+
+# a token always ends after a punctuation char, or after a space char followed by a different char,
+# so tokenizing can restart from scratch there without changing the output
+_TOKEN_BOUNDARY = re.compile('%s|(%s)(?!\\1)' % (
+    '[%s]' % ''.join(re.escape(char) for char in sorted((PUNCTUATION | UNPRINTABLE_CHARS) - UNICODE_SPACES)),
+    '[%s]' % ''.join(re.escape(char) for char in sorted(UNICODE_SPACES))))
+
+
+def _tokenizer_regex(tokenizer, emit_space=True, emit_punc=True):
+    """
+    regex that finds the same tokens as `space_tokenize` or `char_group_tokenize` (apart from token_max_len)
+    :param tokenizer: 'space' or 'char_group'
+    :rtype: re.Pattern
+    """
+    key = (tokenizer, emit_space, emit_punc)
+    if key not in _TOKENIZER_REGEXES:
+        punctuation = (PUNCTUATION | UNPRINTABLE_CHARS) - UNICODE_SPACES
+        special = UNICODE_SPACES | punctuation
+        if tokenizer == 'char_group':
+            special |= ALPHABET | NUMBERS
+
+        # runs of letters etc, runs of the same space char, single punctuation chars (most common first)
+        words = ['[^%s]+' % ''.join(re.escape(char) for char in sorted(special))]
+        if tokenizer == 'char_group':
+            words = ['[a-zA-Z]+', '[0-9]+'] + words
+        parts = words[:1]
+        if emit_space:
+            parts.append(' +')
+        if emit_punc:
+            parts.append('[%s]' % ''.join(re.escape(char) for char in sorted(punctuation)))
+        parts.extend(words[1:])
+        if emit_space:
+            parts.extend('%s+' % re.escape(char)
+                         for char in sorted(UNICODE_SPACES - {' '}, key=lambda char: (char != '\n', char)))
+        _TOKENIZER_REGEXES[key] = re.compile('|'.join(parts), flags=re.U)
+    return _TOKENIZER_REGEXES[key]
+
+
+def _regex_tokenize(regex, text, token_max_len, block_size=65536):
+    """
+    tokenize a string with a regex from `_tokenizer_regex`, one block at a time (cut at token boundaries)
+    tokens longer than token_max_len are chunked, like the char-by-char tokenizers do
+    :rtype: Iterator[str]
+    """
+    return itertools.chain.from_iterable(_regex_tokenize_blocks(regex, text, token_max_len, block_size))
+
+
+def _regex_tokenize_blocks(regex, text, token_max_len, block_size):
+    start = 0
+    while start < len(text):
+        boundary = _TOKEN_BOUNDARY.search(text, start + block_size)
+        end = boundary.end() if boundary is not None else len(text)
+        tokens = regex.findall(text, start, end)
+        if tokens and max(map(len, tokens)) > token_max_len:
+            tokens = [token[i:i + token_max_len] for token in tokens for i in range(0, len(token), token_max_len)]
+        yield tokens
+        start = end
+
+
+def _cut_at_token_boundaries(blocks, lookback=4096):
+    """
+    re-cut blocks of text so that each one ends where the built-in tokenizers always end a token
+    (see _TOKEN_BOUNDARY), so that each block can be tokenized separately with the same output
+    whatever comes after the last such place in a block is carried over to the next block
+    :type blocks: Iterable[str]
+    :rtype: Iterator[str]
+    """
+    carry = _TokenBoundaryCarry(lookback)
+    for block in blocks:
+        text = carry.feed(block)
+        if text:
+            yield text
+    text = carry.close()
+    if text:
+        yield text
+
+
+class _TokenBoundaryCarry(object):
+    """
+    text fed a block at a time, cut at the last token boundary (see _last_token_boundary)
+    the text after it is kept as a list of pieces, and only each new block is searched for a boundary,
+    so a long run without any boundary is copied and scanned once instead of once per block
+    """
+
+    __slots__ = ('lookback', 'pieces')
+
+    def __init__(self, lookback=4096):
+        self.lookback = lookback
+        self.pieces = []  # text after the last boundary, none of which is a boundary except maybe its last char
+
+    def feed(self, block):
+        """
+        :return: text up to the last token boundary so far (including what was carried over), or '' if none
+        :rtype: str
+        """
+        # the last char carried over might only become a boundary now that the next char is known
+        last_char = self.pieces[-1][-1:] if self.pieces else ''
+        cut = _last_token_boundary(last_char + block, self.lookback)
+        if not cut:
+            if block:
+                self.pieces.append(block)
+            return ''
+        cut -= len(last_char)
+        text = ''.join(self.pieces) + block[:cut]
+        self.pieces = [block[cut:]] if cut < len(block) else []
+        return text
+
+    def close(self):
+        """
+        :return: everything still carried over
+        :rtype: str
+        """
+        text = ''.join(self.pieces)
+        self.pieces = []
+        return text
+
+
+def _last_token_boundary(block, lookback=4096):
+    """
+    position of the last token boundary in a block that more text can't move (see _cut_at_token_boundaries)
+    :return: index into block, or 0 if there isn't one
+    """
+    cut = 0
+    for start in (max(0, len(block) - lookback), 0):
+        for boundary in _TOKEN_BOUNDARY.finditer(block, start):
+            # a space char at the very end might continue in the next block
+            if boundary.end() < len(block):
+                cut = boundary.end()
+        if cut or not start:
+            break
+    return cut
+
+
 def yield_lines(file_path, make_lower=False, threshold_len=0):
     """
     yields all non-empty lines in a file
@@ -298,8 +496,297 @@ def yield_lines(file_path, make_lower=False, threshold_len=0):
                 yield line
 
 
+# a single char or escaped char, which can go into a character class
+_REGEX_UNIT = re.compile(r'\\?.')
+
+
+def _to_regex(head, children, is_terminal, fix_spaces=True, fix_quotes=True, fix_fffd=True):
+    """
+    build a regex from a trie in one pass
+    groups are simplified as they are closed:
+    a group with a single char or escaped char becomes that char ((?:a)? -> a?)
+    a group of 2 to 12 single chars or escaped chars becomes a character class ((?:a|b|c) -> [abc])
+    :param head: root node
+    :param children: function(node) -> [(token, child_node), ...] in sorted order
+    :param is_terminal: function(node) -> whether the node has a REPLACEMENT
+    """
+    # each frame: node, children left to add, number of children, parts of the regex for the node's children,
+    # and whether every child so far was a single char with nothing after it
+    _parts = []
+    _stack = [(None, [], 0, _parts, True), (head, children(head)[::-1], None, [], True)]
+    _escaped = dict()  # {token: (escaped token, whether it is a single char or escaped char)}
+    while _stack:
+        head, items, num_children, parts, all_units = _stack.pop(-1)
+        if num_children is None:
+            num_children = len(items)
+        if items:
+            key, child = items.pop(-1)
+
+            # add new item
+            if parts:
+                parts.append('|')
+
+            # character escaping and whitespace handling (once per distinct token)
+            token = key
+            if token not in _escaped:
+                key = re.escape(token)
+                if fix_fffd:
+                    key = key.replace('\ufffd', '.')  # unicode replacement character
+                if fix_quotes:
+                    key = key.replace('\u2019', u"[\u2019']")  # quote
+                if fix_spaces:
+                    key = re.sub(r'\s', r'\\\\s', key).replace(r'\\\s', r'\s')  # weird bug
+                _escaped[token] = key, _REGEX_UNIT.fullmatch(key) is not None
+            key, is_unit = _escaped[token]
+            parts.append(key)
+
+            # one level down, and come back to this node afterwards
+            _stack.append((head, items, num_children, parts, all_units and is_unit))
+            _stack.append((child, children(child)[::-1], None, [], True))
+
+        elif _stack:
+            # close this node's group and append it to the parent's parts
+            parent_head, parent_items, parent_num_children, parent_parts, parent_all_units = _stack.pop(-1)
+            if parts:
+                parent_all_units = False
+                if all_units and num_children == 1 and is_terminal(head):
+                    parent_parts.append(parts[0])
+                    parent_parts.append('?')
+                elif all_units and 2 <= num_children <= 12:
+                    parent_parts.append('[')
+                    parent_parts.extend(parts[::2])
+                    parent_parts.append(']?' if is_terminal(head) else ']')
+                elif is_terminal(head):
+                    parent_parts.append('(?:')
+                    parent_parts.extend(parts)
+                    parent_parts.append(')?')
+                elif num_children != 1:
+                    parent_parts.append('(?:')
+                    parent_parts.extend(parts)
+                    parent_parts.append(')')
+                else:
+                    parent_parts.extend(parts)
+            _stack.append((parent_head, parent_items, parent_num_children, parent_parts, parent_all_units))
+
+    return ''.join(_parts)
+
+
+def _iter_token_paths(head, children, is_terminal):
+    """
+    yield the token path of every key in a trie, in sorted order (including the root, if it is a key)
+    """
+    _path = []
+    _stack = [children(head)[::-1]]
+    if is_terminal(head):
+        yield ()
+    while _stack:
+        items = _stack[-1]
+        if items:
+            token, child = items.pop(-1)
+            _path.append(token)
+            if is_terminal(child):
+                yield tuple(_path)
+            _stack.append(children(child)[::-1])
+        else:
+            _stack.pop(-1)
+            if _path:
+                _path.pop(-1)
+
+
+def _to_regex_shards(head, children, is_terminal, max_size=65536, flags=0,
+                     fix_spaces=True, fix_quotes=True, fix_fffd=True):
+    """
+    split the keys of a trie (in sorted order) into runs whose regex is at most max_size chars, and compile each one
+    a single key whose regex is longer than max_size gets a shard of its own
+    :rtype: list[re.Pattern]
+    """
+
+    def shard_regex(paths):
+        # regex of a small trie containing only these keys
+        shard_head = AhoCorasickReplace.Node()
+        for path in paths:
+            node = shard_head
+            for token in path:
+                node = node.setdefault(token, AhoCorasickReplace.Node())
+            node.REPLACEMENT = None
+        return _to_regex(shard_head,
+                         lambda node: sorted(node.items(), key=lambda item: item[0]),
+                         lambda node: node.REPLACEMENT is not _SENTINEL,
+                         fix_spaces=fix_spaces, fix_quotes=fix_quotes, fix_fffd=fix_fffd)
+
+    def add_shards(paths):
+        # the size estimate is rough, so halve any run that still comes out too long
+        pattern = shard_regex(paths)
+        if len(pattern) > max_size and len(paths) > 1:
+            add_shards(paths[:len(paths) // 2])
+            add_shards(paths[len(paths) // 2:])
+        else:
+            patterns.append(pattern)
+
+    patterns = []
+    paths = []
+    size = 0
+    previous_path = ()
+    token_sizes = dict()
+    for path in _iter_token_paths(head, children, is_terminal):
+        # sorted keys share prefixes with the previous key, which only appear once in the regex
+        common = 0
+        while common < min(len(path), len(previous_path)) and path[common] == previous_path[common]:
+            common += 1
+        cost = 4
+        for token in path[common:]:
+            if token not in token_sizes:
+                token_sizes[token] = len(re.escape(token))
+            cost += token_sizes[token]
+        if paths and size + cost > max_size:
+            add_shards(paths)
+            paths = []
+            size = 0
+        paths.append(path)
+        size += cost
+        previous_path = path
+    if paths:
+        add_shards(paths)
+    return [re.compile(pattern, flags=flags) for pattern in patterns]
+
+
+def _range_may_contain(prefix, start, stop):
+    """
+    whether any key starting with prefix can be in [start, stop) (None means unbounded)
+    """
+    return (stop is None or prefix < stop) and (start is None or prefix >= start[:len(prefix)])
+
+
+def _range_contains_all(prefix, start, stop):
+    """
+    whether every key starting with prefix is in [start, stop) (None means unbounded)
+    """
+    return (start is None or prefix >= start) and (stop is None or (prefix < stop and not stop.startswith(prefix)))
+
+
+def _iter_key_range(head, children, is_terminal, start, stop):
+    """
+    yield (key, node) for every key in [start, stop), in the same order as items()
+    only descends into subtrees that can contain such a key, so the cost depends on the output, not the trie
+    """
+    _stack = [('', children(head)[::-1])]
+    while _stack:
+        prefix, items = _stack[-1]
+        if items:
+            token, child = items.pop(-1)
+            key = prefix + token
+            if not _range_may_contain(key, start, stop):
+                continue
+            if is_terminal(child) and (start is None or key >= start):
+                yield key, child
+            _stack.append((key, children(child)[::-1]))
+        else:
+            _stack.pop(-1)
+
+
+def _trie_stats(num_nodes, num_keys, max_depth, total_key_depth, branching, total_bytes):
+    """
+    :param branching: Counter of {number of children: number of nodes}
+    :rtype: dict
+    """
+    return {'num_nodes':      num_nodes,
+            'num_keys':       num_keys,
+            'max_depth':      max_depth,
+            'mean_depth':     total_key_depth / num_keys if num_keys else 0.0,  # tokens per key
+            'branching':      dict(sorted(branching.items())),
+            'bytes_per_node': total_bytes / num_nodes,
+            'terminal_share': num_keys / num_nodes,  # share of nodes with a REPLACEMENT
+            }
+
+
 _SENTINEL = object()
 
+# one match from finditer, without the matched text (slice the input with char_start:char_end to get it)
+# start/end are token offsets, char_start/char_end are character offsets
+TrieMatch = collections.namedtuple('TrieMatch', ['start', 'end', 'char_start', 'char_end', 'replacement'])
+
+
+def _iterate_tokens(seq):
+    # default tokenizer: every element of the input is a token
+    for elem in seq:
+        yield elem
+
+
+def _yield_file_tokens(tokenizer, file_path, encoding='utf8', block_size=1048576):
+    """
+    yield tokens from a file given its path
+    the file is read in large blocks, and with no tokenizer or a built-in one each block is tokenized at once
+    (cut where a token always ends, so no token spans two blocks)
+    any other tokenizer still gets one stream of chars, since it might not restart cleanly at those cuts
+    :param tokenizer: the trie's tokenizer
+    :param file_path: file to read
+    :param block_size: chars (or bytes) per read
+    """
+    with io.open(file_path, mode=('r', 'rb')[encoding is None], encoding=encoding) as f:
+        blocks = iter(functools.partial(f.read, block_size), ('', b'')[encoding is None])
+        tokenizer_func = getattr(tokenizer, 'func', tokenizer)  # look inside functools.partial
+
+        if tokenizer_func is _iterate_tokens:
+            tokens = itertools.chain.from_iterable(blocks)
+        elif tokenizer_func in (space_tokenize, char_group_tokenize) and encoding is not None:
+            tokens = itertools.chain.from_iterable(map(tokenizer, _cut_at_token_boundaries(blocks)))
+        else:
+            tokens = tokenizer(itertools.chain.from_iterable(blocks))
+
+        for token in tokens:
+            yield token
+
+
+def _translate_file(trie, input_path, output_path, encoding='utf8', buffer_size=1048576):
+    """
+    translate one file, writing to output_path + '.partial' and then renaming it to output_path
+    (so output_path is never partly written, and the .partial file is removed on failure)
+    output is written in chunks of about buffer_size instead of one token at a time
+    with encoding=None and an automaton compiled with an encoding, the input is memory-mapped and translated as bytes
+    :param trie: AhoCorasickReplace, AhoCorasickAutomaton, or CompactTrie
+    """
+    if encoding is None and getattr(trie, 'encoding', None) is None:
+        raise ValueError('encoding=None translates bytes, which needs an automaton from compile(encoding=...)')
+
+    # recursively make necessary folders (other processes might be making the same ones)
+    if os.path.dirname(output_path):
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+
+    temp_path = output_path + '.partial'
+    try:
+        if encoding is None and getattr(trie, 'encoding', None) is not None:
+            # bytes mode: unchanged parts of the memory-mapped input are written straight from the mapping
+            with io.open(input_path, mode='rb') as f_in, io.open(temp_path, mode='wb') as f:
+                if os.fstat(f_in.fileno()).st_size:  # mmap can't map an empty file
+                    with mmap.mmap(f_in.fileno(), 0, access=mmap.ACCESS_READ) as _mmap:
+                        output_chunks = trie.translate_buffer(_mmap)
+                        try:
+                            for output_chunk in output_chunks:
+                                f.write(output_chunk)
+                        finally:
+                            output_chunks.close()  # release the slices before closing the mmap
+                            output_chunk = None
+        else:
+            with io.open(temp_path, mode=('w', 'wb')[encoding is None], encoding=encoding) as f:
+                empty = ('', b'')[encoding is None]
+                output_buffer = []
+                buffered_size = 0
+                for output_chunk in trie.translate(_yield_file_tokens(trie.tokenizer, input_path, encoding=encoding)):
+                    output_buffer.append(output_chunk)
+                    buffered_size += len(output_chunk)
+                    if buffered_size >= buffer_size:
+                        f.write(empty.join(output_buffer))
+                        output_buffer = []
+                        buffered_size = 0
+                f.write(empty.join(output_buffer))
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    # rename to output
+    os.replace(temp_path, output_path)
+
 
 class AhoCorasickReplace(object):
     """
@@ -307,9 +794,13 @@ class AhoCorasickReplace(object):
     to find and replace lots of things in one pass
     something like aho-corasick search
     but at a token level
+    with a `fold` function (e.g. fold_case), keys are stored folded and input is folded one token at a time,
+    so matching ignores case without copying the text, and unmatched tokens are output unchanged
+    (folding happens after tokenizing, so it can't change where a tokenizer splits, e.g. space_tokenize on "isn’t")
+    not safe to change while other threads are reading it, use `freeze()` or `compile()` to share it between threads
     """
 
-    __slots__ = ('head', 'tokenizer')
+    __slots__ = ('head', 'tokenizer', 'fold')
 
     @staticmethod
     def fromkeys(keys, default='', verbose=False):
@@ -324,43 +815,52 @@ class AhoCorasickReplace(object):
         def __init__(self):
             self.REPLACEMENT = _SENTINEL
 
-    def __init__(self, lexer=None, replacements=None):
+    def __init__(self, lexer=None, replacements=None, fold=None):
         """
         :type lexer: Iterable -> Iterable
+        :param fold: function(token) -> token used for matching, e.g. fold_case or fold_unicode (None to match exactly)
         """
         self.head = self.Node()
 
         if lexer is None:
-            def lexer(seq):
-                for elem in seq:
-                    yield elem
+            lexer = _iterate_tokens
         self.tokenizer = lexer
+        self.fold = fold
 
         if replacements is not None:
             self.update(replacements)
 
+    def _key_tokens(self, key):
+        """
+        tokenize (and fold) a key
+        """
+        if self.fold is None:
+            return self.tokenizer(key)
+        return [self.fold(token) for token in self.tokenizer(key)]
+
     def __contains__(self, key):
         head = self.head
-        for token in self.tokenizer(key):
+        for token in self._key_tokens(key):
             if token not in head:
                 return False
             head = head[token]
         return head.REPLACEMENT is not _SENTINEL
 
     def _item_slice(self, start, stop, step=None):
-        out = []
-        for key, value in self.items():
-            if key >= stop:
-                return out[::step]
-            elif key >= start:
-                out.append((key, value))
-        return out[::step]
+        """
+        (key, value) pairs for keys in [start, stop), skipping subtrees that are out of range
+        """
+        return [(key, head.REPLACEMENT)
+                for key, head in _iter_key_range(self.head,
+                                                 lambda head: sorted(head.items(), key=lambda item: item[0]),
+                                                 lambda head: head.REPLACEMENT is not _SENTINEL,
+                                                 start, stop)][::step]
 
     def __getitem__(self, key):
         if type(key) is slice:
             return [value for key, value in self._item_slice(key.start, key.stop, key.step)]
         head = self.head
-        for token in self.tokenizer(key):
+        for token in self._key_tokens(key):
             if token not in head:
                 raise KeyError(key)
             head = head[token]
@@ -370,7 +870,7 @@ class AhoCorasickReplace(object):
 
     def setdefault(self, key, value):
         head = self.head
-        for token in self.tokenizer(key):
+        for token in self._key_tokens(key):
             head = head.setdefault(token, self.Node())
         if head.REPLACEMENT is not _SENTINEL:
             return head.REPLACEMENT
@@ -379,7 +879,7 @@ class AhoCorasickReplace(object):
 
     def __setitem__(self, key, value):
         head = self.head
-        for token in self.tokenizer(key):
+        for token in self._key_tokens(key):
             head = head.setdefault(token, self.Node())
         head.REPLACEMENT = value
         return value
@@ -391,8 +891,10 @@ class AhoCorasickReplace(object):
 
         head = self.head
         breadcrumbs = [(None, head)]
-        for token in self.tokenizer(key):
-            head = head.setdefault(token, self.Node())
+        for token in self._key_tokens(key):
+            if token not in head:
+                raise KeyError(key)
+            head = head[token]
             breadcrumbs.append((token, head))
         if head.REPLACEMENT is _SENTINEL:
             raise KeyError(key)
@@ -428,56 +930,25 @@ class AhoCorasickReplace(object):
                 assert not _stack
 
     def to_regex(self, fix_spaces=True, fix_quotes=True, fix_fffd=True):
-        _parts = [[], []]
-        _stack = [(self.head, sorted(self.head.keys(), reverse=True))]
-        while _stack:
-            head, keys = _stack.pop(-1)
-            if keys:
-                key = keys.pop(-1)
-                _stack.append((head, keys))
-                head = head[key]
+        return _to_regex(self.head,
+                         lambda head: sorted(head.items(), key=lambda item: item[0]),
+                         lambda head: head.REPLACEMENT is not _SENTINEL,
+                         fix_spaces=fix_spaces, fix_quotes=fix_quotes, fix_fffd=fix_fffd)
 
-                # add new item
-                if _parts[-1]:
-                    _parts[-1].append('|')
-
-                # character escaping and whitespace handling
-                key = re.escape(key)
-                if fix_fffd:
-                    key = key.replace('\ufffd', '.')  # unicode replacement character
-                if fix_quotes:
-                    key = key.replace('\u2019', u"[\u2019']")  # quote
-                if fix_spaces:
-                    key = re.sub(r'\s', r'\\\\s', key).replace(r'\\\s', r'\s')  # weird bug
-                _parts[-1].append(key)
-
-                # one level down
-                _stack.append((head, sorted(head.keys(), reverse=True)))
-                _parts.append([])
-
-            else:
-                _current_parts = _parts.pop()
-                if _current_parts:
-                    if head.REPLACEMENT is not _SENTINEL:
-                        _parts[-1].append('(?:')
-                        _parts[-1].extend(_current_parts)
-                        _parts[-1].append(')?')
-                    elif len(head) != 1:
-                        _parts[-1].append('(?:')
-                        _parts[-1].extend(_current_parts)
-                        _parts[-1].append(')')
-                    else:
-                        _parts[-1].extend(_current_parts)
-
-        assert len(_parts) == 1
-        re_pattern = ''.join(_parts[0])
-        # simplify singleton groups
-        re_pattern = re.sub(r'\(\?:(\\?.)\)', r'\1', re_pattern)
-        # simplify single-char option groups
-        re_pattern = re.sub(r'\(\?:(\\?.)(?:\|(\\?.))(?:\|(\\?.))?(?:\|(\\?.))?(?:\|(\\?.))?(?:\|(\\?.))?'
-                            r'(?:\|(\\?.))?(?:\|(\\?.))?(?:\|(\\?.))?(?:\|(\\?.))?(?:\|(\\?.))?(?:\|(\\?.))?\)',
-                            lambda x: '[%s]' % (''.join(y for y in x.groups() if y is not None)), re_pattern)
-        return re_pattern
+    def to_regex_shards(self, max_size=65536, flags=0, fix_spaces=True, fix_quotes=True, fix_fffd=True):
+        """
+        like to_regex, but split into several compiled regexes of at most max_size chars each
+        each shard covers a run of keys in sorted order, so to find everything, search with every shard
+        (the shards don't know about each other, so overlapping matches from different shards are all found)
+        :param max_size: maximum length of each regex pattern
+        :param flags: flags for re.compile
+        :rtype: list[re.Pattern]
+        """
+        return _to_regex_shards(self.head,
+                                lambda head: sorted(head.items(), key=lambda item: item[0]),
+                                lambda head: head.REPLACEMENT is not _SENTINEL,
+                                max_size=max_size, flags=flags,
+                                fix_spaces=fix_spaces, fix_quotes=fix_quotes, fix_fffd=fix_fffd)
 
     def keys(self):
         for key, value in self.items():
@@ -487,13 +958,67 @@ class AhoCorasickReplace(object):
         for key, value in self.items():
             yield value
 
+    def stats(self):
+        """
+        shape of the trie, from one walk over the nodes (no keys are built)
+        bytes_per_node is the average sys.getsizeof of a node, not counting the tokens and replacements
+        (compare with `freeze().stats()` to see what the compact layout would save)
+        :return: {'num_nodes', 'num_keys', 'max_depth', 'mean_depth', 'branching', 'bytes_per_node', 'terminal_share'}
+        :rtype: dict
+        """
+        num_nodes = num_keys = max_depth = total_key_depth = total_bytes = 0
+        branching = collections.Counter()
+        _stack = [(self.head, 0)]
+        while _stack:
+            head, depth = _stack.pop(-1)
+            num_nodes += 1
+            total_bytes += sys.getsizeof(head)
+            branching[len(head)] += 1
+            if head.REPLACEMENT is not _SENTINEL:
+                num_keys += 1
+                total_key_depth += depth
+            if depth > max_depth:
+                max_depth = depth
+            for child in head.values():
+                _stack.append((child, depth + 1))
+        return _trie_stats(num_nodes, num_keys, max_depth, total_key_depth, branching, total_bytes)
+
     def __delitem__(self, key):
         if type(key) is slice:
-            for key, value in self._item_slice(key.start, key.stop, key.step):
-                self.pop(key)
+            if key.step in (None, 1):
+                self._delete_range(key.start, key.stop)
+            else:
+                for key, value in self._item_slice(key.start, key.stop, key.step):
+                    self.pop(key)
         else:
             self.pop(key)
 
+    def _delete_range(self, start, stop):
+        """
+        delete every key in [start, stop) in one pass
+        subtrees entirely in range are dropped whole, subtrees entirely out of range are never visited,
+        and nodes left without keys below them are removed on the way back up
+        """
+        _stack = [(self.head, None, None, '', False)]  # (node, parent, token, key, children visited)
+        while _stack:
+            head, parent, token, key, visited = _stack.pop(-1)
+            if visited:
+                if parent is not None and not head and head.REPLACEMENT is _SENTINEL:
+                    del parent[token]
+                continue
+
+            if parent is not None and (start is None or key >= start):  # already known to be before stop
+                head.REPLACEMENT = _SENTINEL
+            _stack.append((head, parent, token, key, True))
+            for child_token in list(head.keys()):
+                child_key = key + child_token
+                if not _range_may_contain(child_key, start, stop):
+                    continue
+                if _range_contains_all(child_key, start, stop):
+                    del head[child_token]
+                else:
+                    _stack.append((head[child_token], head, child_token, child_key, False))
+
     def update(self, replacements, verbose=True):
         """
         :type replacements: list[(str, str)] | dict[str, str] | Generator[(str, str), Any, None]
@@ -513,14 +1038,124 @@ class AhoCorasickReplace(object):
             self[sequence] = replacement
         return self
 
-    def _yield_tokens(self, file_path, encoding='utf8'):
+    def bulk_update(self, replacements, sort=False, verbose=True):
+        """
+        same result as `update`, but much faster for large numbers of keys
+        each key starts from the node where its common prefix with the previous key ends (so sorted keys are best),
+        only allocates nodes that don't exist yet, and pauses the cyclic garbage collector while building
+        :type replacements: list[(str, str)] | dict[str, str] | Generator[(str, str), Any, None]
+        :param sort: sort the pairs by key first (for duplicate keys the last one still wins)
+        :type sort: bool
+        :type verbose: bool
+        """
+        if type(replacements) is dict:
+            replacements = replacements.items()
+        if sort:
+            replacements = sorted(replacements, key=lambda item: item[0])
+        if type(replacements) is list or type(replacements) is type({}.items()):
+            print_str = '(%%d pairs loaded out of %d)' % len(replacements)
+        else:
+            print_str = '(%d pairs loaded)'
+
+        tokenizer = self.tokenizer
+        fold = self.fold
+        node_class = self.Node
+        previous_tokens = ()
+        path = [self.head]  # path[i] is the node reached by the first i tokens of the previous key
+        count = 0
+
+        gc_was_enabled = gc.isenabled()
+        gc.disable()  # millions of new nodes would otherwise trigger lots of pointless collections
+        t = time.time()
+        try:
+            for count, (sequence, replacement) in enumerate(replacements, 1):
+                if verbose and count % 50000 == 0:
+                    print(print_str % count)
+
+                # strings can be indexed directly, skipping the default tokenizer's generator
+                if fold is not None:
+                    tokens = [fold(token) for token in tokenizer(sequence)]
+                elif tokenizer is _iterate_tokens and type(sequence) is str:
+                    tokens = sequence
+                else:
+                    tokens = list(tokenizer(sequence))
+
+                common = 0
+                max_common = min(len(tokens), len(previous_tokens))
+                while common < max_common and tokens[common] == previous_tokens[common]:
+                    common += 1
+                del path[common + 1:]
+
+                head = path[-1]
+                for index in range(common, len(tokens)):
+                    child = head.get(tokens[index])
+                    if child is None:
+                        child = head[tokens[index]] = node_class()
+                    path.append(child)
+                    head = child
+                head.REPLACEMENT = replacement
+                previous_tokens = tokens
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+
+        if verbose:
+            elapsed = time.time() - t
+            print('(%d pairs loaded in %s, %d pairs per second)' %
+                  (count, format_seconds(elapsed), count / elapsed if elapsed else count))
+        return self
+
+    def compile(self, encoding=None):
+        """
+        build a read-only AhoCorasickAutomaton (with failure links) from the current contents
+        translate and find_all on the automaton give the same output, but in linear time
+        :param encoding: encode the keys to match bytes input instead (see AhoCorasickAutomaton.translate_buffer)
+        :rtype: AhoCorasickAutomaton
+        """
+        return AhoCorasickAutomaton(self, encoding=encoding)
+
+    def _encoded(self, encoding):
         """
-        yield tokens from a file given its path
+        copy with one token per byte: keys encoded, and str replacements encoded too
+        the keys match wherever their bytes appear, as if they were tokenized with the default tokenizer
+        """
+        if self.fold is not None:
+            raise ValueError('fold functions are not supported for bytes input')
+
+        def encoded_items():
+            for key, value in self.items():
+                # checked here, since a bad replacement would otherwise only fail when it is written out
+                if type(value) is str:
+                    value = value.encode(encoding)
+                elif not isinstance(value, (bytes, bytearray)):
+                    raise ValueError('replacements must be str or bytes for bytes input, got %r for key %r' %
+                                     (value, key))
+                yield key.encode(encoding), bytes(value)
+
+        return AhoCorasickReplace().bulk_update(encoded_items(), verbose=False)
+
+    def freeze(self):
+        """
+        build a read-only CompactTrie from the current contents
+        same lookups, iteration, translate and find_all, but stored in a few flat arrays instead of nested dicts
+        :rtype: CompactTrie
+        """
+        return CompactTrie(self)
+
+    def save(self, path):
+        """
+        freeze and write to a file that `CompactTrie.load` can memory-map (see `CompactTrie.save`)
+        :param path: output file path
+        """
+        self.freeze().save(path)
+
+    def _yield_tokens(self, file_path, encoding='utf8', block_size=1048576):
+        """
+        yield tokens from a file given its path (see _yield_file_tokens)
         :param file_path: file to read
+        :param block_size: chars (or bytes) per read
         """
-        with io.open(file_path, mode=('r', 'rb')[encoding is None], encoding=encoding) as f:
-            for token in self.tokenizer(char for line in f for char in line):
-                yield token
+        return _yield_file_tokens(self.tokenizer, file_path, encoding=encoding, block_size=block_size)
 
     def translate(self, input_sequence):
         """
@@ -529,56 +1164,43 @@ class AhoCorasickReplace(object):
         :type input_sequence: str | Iterable
         """
         output_buffer = collections.deque()  # [(index, token), ...]
-        matches = dict()  # {span_start: (span_end + 1, REPLACEMENT), ...} <-- because: match == seq[start:end+1]
-        spans = dict()  # positions that are partial matches: {span_start: span_head, ...}
-        matches_to_remove = set()  # positions where matches may not start
-        spans_to_remove = set()  # positions where matches may not start, or where matching failed
+        matches = collections.deque()  # [(span_start, span_end + 1, REPLACEMENT), ...] <-- sorted by span_start
+        spans = []  # positions that are partial matches: [(span_start, span_head), ...] <-- sorted by span_start
+        fold = self.fold
 
         for index, input_item in enumerate(input_sequence):
             # append new item to output_buffer
             output_buffer.append((index, input_item))
+            if fold is not None:
+                input_item = fold(input_item)  # only for matching, the original goes to the output
 
             # append new span to queue
-            spans[index] = self.head
-
-            # reset lists of things to remove
-            matches_to_remove.clear()  # clearing is faster than creating a new set
-            spans_to_remove.clear()
+            spans.append((index, self.head))
 
-            # process spans in queue
-            for span_start, span_head in spans.items():
+            # process spans in queue (in order of start), dropping those that fail to match the current token
+            live_spans = []
+            for span_start, span_head in spans:
                 if input_item in span_head:
                     new_head = span_head[input_item]
-                    spans[span_start] = new_head
+                    live_spans.append((span_start, new_head))
                     if new_head.REPLACEMENT is not _SENTINEL:
-                        matches[span_start] = (index + 1, new_head.REPLACEMENT)
-
                         # longest subsequence matching does not allow one match to start within another match
-                        matches_to_remove.update(range(span_start + 1, index + 1))
-                        spans_to_remove.update(range(span_start + 1, index + 1))
-
-                else:
-                    # failed to match the current token
-                    spans_to_remove.add(span_start)
+                        # so every match and span that starts later is dropped, and matches stay sorted
+                        while matches and matches[-1][0] >= span_start:
+                            matches.pop()
+                        matches.append((span_start, index + 1, new_head.REPLACEMENT))
+                        break
+            spans = live_spans
 
-            # remove impossible spans and matches from queues
-            for span_start in matches_to_remove:
-                if span_start in matches:
-                    del matches[span_start]
-            for span_start in spans_to_remove:
-                if span_start in spans:
-                    del spans[span_start]
-
-            # get indices of matches and spans
-            first_match = min(matches) if matches else index
-            first_span = min(spans) if spans else index
+            # get index of first span
+            first_span = spans[0][0] if spans else index
 
             # emit all matches that start before the first span
-            while first_match < first_span:
+            while matches and matches[0][0] < first_span:
                 # take info
-                match_end, match_replacement = matches[first_match]
+                match_start, match_end, match_replacement = matches.popleft()
                 # emit until match start
-                while output_buffer and output_buffer[0][0] < first_match:
+                while output_buffer and output_buffer[0][0] < match_start:
                     yield output_buffer.popleft()[1]
                 # clear output_buffer until match end
                 while output_buffer and output_buffer[0][0] < match_end:  # remember match_end already has the +1
@@ -586,16 +1208,13 @@ class AhoCorasickReplace(object):
                 # emit replacement
                 for item in match_replacement:
                     yield item
-                # grab next match and retry
-                del matches[first_match]
-                first_match = min(matches) if matches else index
 
             # emit until span
             while output_buffer and output_buffer[0][0] < first_span:
                 yield output_buffer.popleft()[1]
 
         # ignore remaining unmatched spans, yield matches only
-        for match_start, (match_end, match_replacement) in sorted(matches.items()):
+        for match_start, match_end, match_replacement in matches:
             # emit until match start
             while output_buffer and output_buffer[0][0] < match_start:  # remember match_end already has the +1
                 yield output_buffer.popleft()[1]
@@ -610,6 +1229,43 @@ class AhoCorasickReplace(object):
         while output_buffer:
             yield output_buffer.popleft()[1]
 
+    async def translate_stream(self, reader, writer, encoding='utf8', read_size=65536):
+        """
+        translate everything from an asyncio.StreamReader to an asyncio.StreamWriter, until the reader is at EOF
+        each chunk read is decoded, tokenized (up to the last token boundary) and matched as it arrives,
+        and partial matches carry over between chunks, so the output is the same as translating the whole stream
+        whatever output is final after each chunk is written in one batch, then `drain()` applies flow control
+        (the writer is not closed)
+        only the default tokenizer, space_tokenize, and char_group_tokenize can be split into chunks like this
+        :param reader: asyncio.StreamReader (or anything with `async read(n)`)
+        :param writer: asyncio.StreamWriter (or anything with `write(data)` and `async drain()`)
+        :param encoding: encoding of both streams
+        :param read_size: bytes per read
+        """
+        tokenizer_func = getattr(self.tokenizer, 'func', self.tokenizer)  # look inside functools.partial
+        if tokenizer_func not in (_iterate_tokens, space_tokenize, char_group_tokenize):
+            raise ValueError('only the built-in tokenizers can be used on a stream')
+
+        decoder = codecs.getincrementaldecoder(encoding)()
+        translator = _PushTranslate(self)
+        carry = _TokenBoundaryCarry()  # text after the last token boundary, which the next chunk might continue
+        while True:
+            data = await reader.read(read_size)
+            text = decoder.decode(data, final=not data)
+            if not data:
+                text = carry.close() + text
+            elif tokenizer_func is not _iterate_tokens:
+                text = carry.feed(text)
+
+            output = translator.feed(self.tokenizer(text) if text else ())
+            if not data:
+                output.extend(translator.close())
+            if output:
+                writer.write(''.join(output).encode(encoding))
+                await writer.drain()
+            if not data:
+                break
+
     def find_all(self, input_sequence, allow_overlapping=False, tokenizer=True):
         """
         finds all occurrences within a string
@@ -620,69 +1276,107 @@ class AhoCorasickReplace(object):
         :param tokenizer: fundtoin to tokenize input, or True to use pre-defined tokenizer
         :type tokenizer: bool | function
         """
-        matches = dict()  # {span_start: (span_end + 1, [span_stuff, ...]), ...} <-- because: match == seq[start:end+1]
-        spans = dict()  # positions that are partial matches: {span_start: (span_head, [span_stuff, ...]), ...}
-        matches_to_remove = set()  # positions where matches may not start
-        spans_to_remove = set()  # positions where matches may not start, or where matching failed
+        matches = collections.deque()  # [(span_start, span_end + 1, [span_stuff, ...]), ...] <-- sorted by span_start
+        spans = []  # positions that are partial matches: [(span_start, span_head, [span_stuff, ...]), ...]
 
         if tokenizer is True:
             tokenizer = self.tokenizer
+        fold = self.fold
 
         for index, input_item in enumerate(tokenizer(input_sequence)):
             # append new span to queue
-            spans[index] = (self.head, [])
-
-            # reset lists of things to remove
-            matches_to_remove.clear()  # clearing is faster than creating a new set
-            spans_to_remove.clear()
-
-            # process spans in queue
-            for span_start, (span_head, span_seq) in spans.items():
-                if input_item in span_head:
-                    new_head = span_head[input_item]
+            spans.append((index, self.head, []))
+            lookup_item = input_item if fold is None else fold(input_item)
+
+            # process spans in queue (in order of start), dropping those that fail to match the current token
+            live_spans = []
+            for span_start, span_head, span_seq in spans:
+                if lookup_item in span_head:
+                    new_head = span_head[lookup_item]
                     span_seq.append(input_item)
-                    spans[span_start] = (new_head, span_seq)
+                    live_spans.append((span_start, new_head, span_seq))
                     if new_head.REPLACEMENT is not _SENTINEL:
-                        matches[span_start] = (index + 1, span_seq[:])
-
                         # longest subsequence matching does not allow one match to start within another match
                         if not allow_overlapping:
-                            matches_to_remove.update(range(span_start + 1, index + 1))
-                            spans_to_remove.update(range(span_start + 1, index + 1))
+                            while matches and matches[-1][0] >= span_start:
+                                matches.pop()
+                            matches.append((span_start, index + 1, span_seq[:]))
+                            break
+                        matches.append((span_start, index + 1, span_seq[:]))
+            spans = live_spans
+
+            # get index of first span
+            first_span = spans[0][0] if spans else index
+            while matches and (allow_overlapping or matches[0][0] < first_span):
+                yield ''.join(matches.popleft()[2])
+
+        for match_start, match_end, match_replacement in matches:
+            yield ''.join(match_replacement)
 
-                else:
-                    # failed to match the current token
-                    spans_to_remove.add(span_start)
-
-            # remove impossible spans and matches from queues
-            for span_start in matches_to_remove:
-                if span_start in matches:
-                    del matches[span_start]
-            for span_start in spans_to_remove:
-                if span_start in spans:
-                    del spans[span_start]
-
-            # get indices of matches and spans
-            first_span = min(spans) if spans else index
-            while matches:
-                match_start = min(matches)
-                if match_start < first_span or allow_overlapping:
-                    yield ''.join(matches[match_start][1])
-                    del matches[match_start]
-                else:
-                    break
+    def finditer(self, input_sequence, allow_overlapping=False, tokenizer=True):
+        """
+        finds the same matches as find_all, but yields TrieMatch(start, end, char_start, char_end, replacement)
+        string tokens count as their length in characters and any other token as 1,
+        so if the tokens join back into the input (as with the built-in tokenizers by default),
+        the matched text is input_sequence[match.char_start:match.char_end]
+        :param input_sequence: iterable of hashable objects
+        :type input_sequence: str | Iterable
+        :param allow_overlapping: yield all overlapping matches (soar -> so, soar, oar)
+        :type allow_overlapping: bool
+        :param tokenizer: function to tokenize input, or True to use pre-defined tokenizer
+        :type tokenizer: bool | function
+        """
+        matches = collections.deque()  # [(start, end, char_start, char_end, REPLACEMENT), ...] <-- sorted by start
+        spans = []  # positions that are partial matches: [(span_start, span_char_start, span_head), ...]
 
-        for match_start, (match_end, match_replacement) in sorted(matches.items()):
-            yield ''.join(match_replacement)
+        if tokenizer is True:
+            tokenizer = self.tokenizer
+        fold = self.fold
 
-    def process_path(self, input_path, output_path, overwrite=False, encoding='utf8'):
+        char_index = 0
+        for index, input_item in enumerate(tokenizer(input_sequence)):
+            # append new span to queue
+            spans.append((index, char_index, self.head))
+            char_index += len(input_item) if type(input_item) is str else 1
+            if fold is not None:
+                input_item = fold(input_item)
+
+            # process spans in queue (in order of start), dropping those that fail to match the current token
+            live_spans = []
+            for span_start, span_char_start, span_head in spans:
+                if input_item in span_head:
+                    new_head = span_head[input_item]
+                    live_spans.append((span_start, span_char_start, new_head))
+                    if new_head.REPLACEMENT is not _SENTINEL:
+                        match = (span_start, index + 1, span_char_start, char_index, new_head.REPLACEMENT)
+                        # longest subsequence matching does not allow one match to start within another match
+                        if not allow_overlapping:
+                            while matches and matches[-1][0] >= span_start:
+                                matches.pop()
+                            matches.append(match)
+                            break
+                        matches.append(match)
+            spans = live_spans
+
+            # get index of first span
+            first_span = spans[0][0] if spans else index
+            while matches and (allow_overlapping or matches[0][0] < first_span):
+                yield TrieMatch(*matches.popleft())
+
+        while matches:
+            yield TrieMatch(*matches.popleft())
+
+    def process_path(self, input_path, output_path, overwrite=False, encoding='utf8', buffer_size=1048576):
         """
         given a path
         make a copy and clean it
+        input is read in blocks (see _yield_tokens) and output is written in chunks of about buffer_size
+        use `process_tree` to process many files in parallel
         :type input_path: str
         :type output_path: str
         :type overwrite: bool
         :type encoding: str
+        :type buffer_size: int
         """
 
         if os.path.exists(output_path) and not overwrite:
@@ -690,35 +1384,940 @@ class AhoCorasickReplace(object):
             if random.random() < 0.001:
                 print('skipped: %s' % output_path)
         else:
-            # recursively make necessary folders
-            if not os.path.isdir(os.path.dirname(output_path)):
-                os.makedirs(os.path.dirname(output_path))
-
             # process to temp file
             print('=' * 100)
             print('processing: %s' % input_path)
-            print('input size: %s' % format_bytes(os.path.getsize(input_path)))
-            temp_path = output_path + '.partial'
+            input_size = os.path.getsize(input_path)
+            print('input size: %s' % format_bytes(input_size))
             t0 = time.time()
 
             try:
-                with io.open(temp_path, mode=('w', 'wb')[encoding is None], encoding=encoding) as f:
-                    for output_chunk in self.translate(self._yield_tokens(input_path, encoding=encoding)):
-                        f.write(output_chunk)
-
-                print('    output: %s' % temp_path[:-8])
+                _translate_file(self, input_path, output_path, encoding=encoding, buffer_size=buffer_size)
+                print('    output: %s' % output_path)
 
             except Exception:
-                os.remove(temp_path)
-                print('    failed: %s' % temp_path)
+                print('    failed: %s' % output_path)
                 raise
 
-            # rename to output
-            if os.path.exists(output_path):
-                os.remove(output_path)
-            os.rename(temp_path, output_path)
             t1 = time.time()
-            print('total time: %s' % format_seconds(t1 - t0))
+            print('throughput: %.2f MB/s (%s)' % (input_size / 1e6 / max(t1 - t0, 1e-9), format_seconds(t1 - t0)))
+
+
+class _PushTranslate(object):
+    """
+    AhoCorasickReplace.translate, but fed tokens a batch at a time instead of pulling them from an iterable
+    partial matches carry over from one batch to the next, so the output is the same as translate on all the tokens
+    """
+
+    __slots__ = ('trie', 'index', 'output_buffer', 'matches', 'spans')
+
+    def __init__(self, trie):
+        """
+        :type trie: AhoCorasickReplace
+        """
+        self.trie = trie
+        self.index = 0  # position of the next token
+        self.output_buffer = collections.deque()  # [(index, token), ...]
+        self.matches = collections.deque()  # [(span_start, span_end + 1, REPLACEMENT), ...] <-- sorted by span_start
+        self.spans = []  # positions that are partial matches: [(span_start, span_head), ...] <-- sorted by span_start
+
+    def feed(self, tokens):
+        """
+        :return: output that can't change any more, as a list of tokens and replacements
+        :rtype: list
+        """
+        output = []
+        trie_head = self.trie.head
+        fold = self.trie.fold
+        output_buffer = self.output_buffer
+        matches = self.matches
+        spans = self.spans
+        index = self.index - 1
+
+        for index, input_item in enumerate(tokens, self.index):
+            output_buffer.append((index, input_item))
+            if fold is not None:
+                input_item = fold(input_item)
+            spans.append((index, trie_head))
+
+            # same as translate
+            live_spans = []
+            for span_start, span_head in spans:
+                if input_item in span_head:
+                    new_head = span_head[input_item]
+                    live_spans.append((span_start, new_head))
+                    if new_head.REPLACEMENT is not _SENTINEL:
+                        while matches and matches[-1][0] >= span_start:
+                            matches.pop()
+                        matches.append((span_start, index + 1, new_head.REPLACEMENT))
+                        break
+            spans = live_spans
+
+            first_span = spans[0][0] if spans else index
+            while matches and matches[0][0] < first_span:
+                match_start, match_end, match_replacement = matches.popleft()
+                while output_buffer and output_buffer[0][0] < match_start:
+                    output.append(output_buffer.popleft()[1])
+                while output_buffer and output_buffer[0][0] < match_end:
+                    output_buffer.popleft()
+                output.append(match_replacement)
+            while output_buffer and output_buffer[0][0] < first_span:
+                output.append(output_buffer.popleft()[1])
+
+        self.index = index + 1
+        self.spans = spans
+        return output
+
+    def close(self):
+        """
+        end of input: flush the matches and tokens still held back
+        :rtype: list
+        """
+        output = []
+        output_buffer = self.output_buffer
+        for match_start, match_end, match_replacement in self.matches:
+            while output_buffer and output_buffer[0][0] < match_start:
+                output.append(output_buffer.popleft()[1])
+            while output_buffer and output_buffer[0][0] < match_end:
+                output_buffer.popleft()
+            output.extend(self.trie.tokenizer(match_replacement))  # same as translate
+        while output_buffer:
+            output.append(output_buffer.popleft()[1])
+        self.matches.clear()
+        self.spans = []
+        return output
+
+
+class _CompiledSearch(object):
+    """
+    leftmost-longest translate and find_all over a compiled automaton with failure links
+    subclasses provide `tokenizer`, `fold`, `fail`, `depth` and `output` (indexed by state, where 0 is the root),
+    plus `_stepper()` and `_replacement(state)`
+    """
+
+    __slots__ = ()
+
+    def _stepper(self):
+        """
+        :return: function(state, token) -> next state, following failure links where needed
+        """
+        raise NotImplementedError
+
+    def _folding_stepper(self):
+        """
+        like _stepper, but folds each input token first (if there is a fold function)
+        """
+        step = self._stepper()
+        fold = self.fold
+        if fold is None:
+            return step
+        return lambda state, token: step(state, fold(token))
+
+    def _replacement(self, state):
+        raise NotImplementedError
+
+    def _leftmost_longest(self, input_sequence):
+        """
+        yields ('token', token) for unmatched tokens and ('match', (tokens, replacement, at_end)) for matches
+        a match is reported as soon as no longer (or earlier-starting) match is possible,
+        then scanning restarts from its end (at most one key's length of tokens gets rescanned)
+        """
+        step = self._folding_stepper()
+        depth = self.depth
+        output = self.output
+
+        buffer = collections.deque()  # tokens not yet emitted, buffer[0] is at position buffer_start
+        buffer_start = 0
+        index = 0  # position of the next token to scan (less than the buffer's end when rescanning)
+        state = 0
+        best_start = best_end = best_state = -1  # leftmost (then longest) match seen so far
+        input_iterator = iter(input_sequence)
+        at_end = False
+
+        while True:
+            if index < buffer_start + len(buffer):
+                state = step(state, buffer[index - buffer_start])
+                index += 1
+                state_start = index - depth[state]
+            elif not at_end:
+                for token in input_iterator:
+                    buffer.append(token)
+                    break
+                else:
+                    at_end = True
+                continue
+            elif best_state >= 0:
+                state_start = index + 1  # end of input, so nothing can extend or pre-empt the best match
+            else:
+                break
+
+            # no partial match starts at or before the best match, so it can't get longer or be pre-empted
+            if best_state >= 0 and state_start > best_start:
+                while buffer_start < best_start:
+                    yield 'token', buffer.popleft()
+                    buffer_start += 1
+                matched = []
+                while buffer_start < best_end:
+                    matched.append(buffer.popleft())
+                    buffer_start += 1
+                yield 'match', (matched, self._replacement(best_state), at_end)
+
+                # rescan from the end of the match
+                index = best_end
+                state = 0
+                best_start = best_end = best_state = -1
+                continue
+
+            # leftmost, then longest
+            if output[state] >= 0:
+                match_start = index - depth[output[state]]
+                if best_state < 0 or match_start <= best_start:
+                    best_start, best_end, best_state = match_start, index, output[state]
+
+            # anything before the start of every possible match is final
+            emit_until = state_start if best_state < 0 else min(state_start, best_start)
+            while buffer_start < emit_until:
+                yield 'token', buffer.popleft()
+                buffer_start += 1
+
+        while buffer:
+            yield 'token', buffer.popleft()
+
+    def translate(self, input_sequence):
+        """
+        processes text and yields output one token at a time
+        same output as AhoCorasickReplace.translate
+        :param input_sequence: iterable of hashable objects, preferably a string
+        :type input_sequence: str | Iterable
+        """
+        for kind, item in self._leftmost_longest(input_sequence):
+            if kind == 'token':
+                yield item
+            else:
+                matched, replacement, at_end = item
+                if at_end:
+                    # same as AhoCorasickReplace.translate, which tokenizes replacements flushed at the end
+                    for token in self.tokenizer(replacement):
+                        yield token
+                else:
+                    for token in replacement:
+                        yield token
+
+    def find_all(self, input_sequence, allow_overlapping=False, tokenizer=True):
+        """
+        finds all occurrences within a string
+        same output as AhoCorasickReplace.find_all
+        :param input_sequence: iterable of hashable objects
+        :type input_sequence: str | Iterable
+        :param allow_overlapping: yield all overlapping matches (soar -> so, soar, oar)
+        :type allow_overlapping: bool
+        :param tokenizer: function to tokenize input, or True to use pre-defined tokenizer
+        :type tokenizer: bool | function
+        """
+        if tokenizer is True:
+            tokenizer = self.tokenizer
+
+        if not allow_overlapping:
+            for kind, item in self._leftmost_longest(tokenizer(input_sequence)):
+                if kind == 'match':
+                    yield ''.join(item[0])
+            return
+
+        # every key ending at each position, from the longest (earliest start) to the shortest
+        step = self._folding_stepper()
+        fail = self.fail
+        depth = self.depth
+        output = self.output
+        recent = collections.deque(maxlen=max(depth))  # the last few tokens, enough for the longest key
+        state = 0
+        for token in tokenizer(input_sequence):
+            recent.append(token)
+            state = step(state, token)
+            match_state = output[state]
+            while match_state >= 0:
+                yield ''.join(list(recent)[len(recent) - depth[match_state]:])
+                match_state = output[fail[match_state]]
+
+    def finditer(self, input_sequence, allow_overlapping=False, tokenizer=True):
+        """
+        finds the same matches as find_all, but yields TrieMatch(start, end, char_start, char_end, replacement)
+        same output as AhoCorasickReplace.finditer
+        :param input_sequence: iterable of hashable objects
+        :type input_sequence: str | Iterable
+        :param allow_overlapping: yield all overlapping matches (soar -> so, soar, oar)
+        :type allow_overlapping: bool
+        :param tokenizer: function to tokenize input, or True to use pre-defined tokenizer
+        :type tokenizer: bool | function
+        """
+        if tokenizer is True:
+            tokenizer = self.tokenizer
+
+        if not allow_overlapping:
+            index = char_index = 0
+            for kind, item in self._leftmost_longest(tokenizer(input_sequence)):
+                if kind == 'token':
+                    index += 1
+                    char_index += len(item) if type(item) is str else 1
+                else:
+                    matched, replacement, at_end = item
+                    start = index
+                    char_start = char_index
+                    index += len(matched)
+                    char_index += sum(len(token) if type(token) is str else 1 for token in matched)
+                    yield TrieMatch(start, index, char_start, char_index, replacement)
+            return
+
+        # every key ending at each position, from the longest (earliest start) to the shortest
+        step = self._folding_stepper()
+        fail = self.fail
+        depth = self.depth
+        output = self.output
+        char_offsets = collections.deque([0], maxlen=max(depth) + 1)  # character offsets of the last few tokens
+        state = 0
+        for index, token in enumerate(tokenizer(input_sequence)):
+            char_offsets.append(char_offsets[-1] + (len(token) if type(token) is str else 1))
+            state = step(state, token)
+            match_state = output[state]
+            while match_state >= 0:
+                yield TrieMatch(index + 1 - depth[match_state], index + 1,
+                                char_offsets[-1 - depth[match_state]], char_offsets[-1],
+                                self._replacement(match_state))
+                match_state = output[fail[match_state]]
+
+
+class AhoCorasickAutomaton(_CompiledSearch):
+    """
+    compiled, read-only snapshot of an AhoCorasickReplace trie, with failure links
+    same leftmost-longest output as AhoCorasickReplace.translate and find_all,
+    but each input token costs (amortized) one transition instead of one step per live partial match
+    build with `AhoCorasickReplace.compile()`, later changes to the trie are not reflected here
+    nothing is modified after it is built, so one automaton can be shared by many threads
+    with an encoding, it matches bytes one at a time instead, and works on buffers (see translate_buffer)
+    """
+
+    __slots__ = ('tokenizer', 'fold', 'encoding', 'goto', 'fail', 'depth', 'output', 'replacements')
+
+    def __init__(self, trie, encoding=None):
+        """
+        :type trie: AhoCorasickReplace
+        :param encoding: None to match str (or token) input, or the encoding of bytes input
+        """
+        self.encoding = encoding
+        if encoding is not None:
+            trie = trie._encoded(encoding)
+        self.tokenizer = trie.tokenizer
+        self.fold = trie.fold
+        self.goto = []  # {token: state, ...} for each state, 0 is the root
+        self.fail = []  # state of the longest proper suffix that is also a prefix of some key
+        self.depth = []  # number of tokens from the root
+        self.output = []  # state of the longest key that is a suffix of this state, or -1
+        self.replacements = []  # REPLACEMENT of each state (or _SENTINEL)
+
+        # number the states breadth-first, so that failure links always point to an earlier state
+        nodes = collections.deque([trie.head])
+        while nodes:
+            node = nodes.popleft()
+            goto = dict()
+            for token, child in node.items():
+                goto[token] = len(self.goto) + len(nodes) + 1
+                nodes.append(child)
+            self.goto.append(goto)
+            self.depth.append(0)
+            self.replacements.append(node.REPLACEMENT)
+
+        # failure and output links, also breadth-first
+        self.fail = [0] * len(self.goto)
+        self.output = [-1] * len(self.goto)  # the root never matches, even if '' is a key
+        for state, goto in enumerate(self.goto):
+            for token, child in goto.items():
+                self.depth[child] = self.depth[state] + 1
+                if state:
+                    fallback = self.fail[state]
+                    while fallback and token not in self.goto[fallback]:
+                        fallback = self.fail[fallback]
+                    self.fail[child] = self.goto[fallback].get(token, 0)
+                if self.replacements[child] is not _SENTINEL:
+                    self.output[child] = child
+                else:
+                    self.output[child] = self.output[self.fail[child]]
+
+    def _stepper(self):
+        goto = self.goto
+        fail = self.fail
+
+        def step(state, token):
+            while state and token not in goto[state]:
+                state = fail[state]
+            return goto[state].get(token, 0)
+
+        return step
+
+    def _replacement(self, state):
+        return self.replacements[state]
+
+    def _buffer_matches(self, data):
+        """
+        yields (start, end, state) for the leftmost-longest matches in a buffer of bytes
+        same matches as _leftmost_longest, but the buffer is indexed directly instead of queueing tokens
+        """
+        step = self._stepper()
+        depth = self.depth
+        output = self.output
+
+        data_len = len(data)
+        index = 0
+        state = 0
+        best_start = best_end = best_state = -1
+        while True:
+            if index < data_len:
+                state = step(state, data[index])
+                index += 1
+                state_start = index - depth[state]
+            elif best_state >= 0:
+                state_start = index + 1  # end of input, so nothing can extend or pre-empt the best match
+            else:
+                break
+
+            # no partial match starts at or before the best match, so it can't get longer or be pre-empted
+            if best_state >= 0 and state_start > best_start:
+                yield best_start, best_end, best_state
+
+                # rescan from the end of the match
+                index = best_end
+                state = 0
+                best_start = best_end = best_state = -1
+                continue
+
+            # leftmost, then longest
+            if output[state] >= 0:
+                match_start = index - depth[output[state]]
+                if best_state < 0 or match_start <= best_start:
+                    best_start, best_end, best_state = match_start, index, output[state]
+
+    def finditer_buffer(self, data):
+        """
+        like finditer, but for an automaton compiled with an encoding, over bytes, mmap, or anything with a buffer
+        start and end (and char_start and char_end) are byte offsets
+        :type data: bytes | bytearray | memoryview | mmap.mmap
+        """
+        if self.encoding is None:
+            raise ValueError('compile with an encoding to search bytes')
+        with memoryview(data).cast('B') as view:
+            for start, end, state in self._buffer_matches(view):
+                yield TrieMatch(start, end, start, end, self.replacements[state])
+
+    def translate_buffer(self, data):
+        """
+        like translate, but for an automaton compiled with an encoding, over bytes, mmap, or anything with a buffer
+        yields memoryview slices of the unchanged parts of data (nothing is copied, decoded, or re-encoded)
+        and the encoded replacements in between
+        :type data: bytes | bytearray | memoryview | mmap.mmap
+        """
+        if self.encoding is None:
+            raise ValueError('compile with an encoding to translate bytes')
+        with memoryview(data).cast('B') as view:
+            position = 0
+            for start, end, state in self._buffer_matches(view):
+                if start > position:
+                    yield view[position:start]
+                yield self.replacements[state]
+                position = end
+            if position < len(view):
+                yield view[position:]
+
+
+# on-disk CompactTrie: header, then each array (native byte order), then the utf8 tokens and replacements
+# every section starts on an 8-byte boundary so that the arrays can be used directly from a read-only mmap
+_COMPACT_MAGIC = b'ACTRIE\x00\x00'
+_COMPACT_VERSION = 1
+_COMPACT_BYTE_ORDER = 0x01020304  # written natively, so a file from a different byte order is detectable
+_COMPACT_HEADER = struct.Struct('=8sIIqqqq')  # magic, version, byte order, nodes, tokens, replacements, none_id
+_COMPACT_ARRAYS = [('first_child', 'I'), ('node_token', 'i'), ('node_value', 'i'),
+                   ('fail', 'i'), ('depth', 'I'), ('output', 'i')]
+
+
+def _align(offset, alignment=8):
+    return offset + (-offset % alignment)
+
+
+class _MappedStrings(object):
+    """
+    read-only list of strings stored as utf8 in a buffer, decoded on access (nothing is decoded up front)
+    `get` finds a string's index by bisection, so it only works if the strings are sorted (like tokens)
+    and remembers the most recent results in a bounded cache (which is thread-safe), so repeated tokens are cheap
+    """
+
+    __slots__ = ('blob', 'offsets', 'none_id', '_cached_find')
+
+    def __init__(self, blob, offsets, none_id=-1, cache_size=65536):
+        """
+        :param blob: utf8 bytes of all strings, concatenated
+        :param offsets: len(strings) + 1 offsets into blob
+        :param none_id: index that holds None instead of a string, or -1
+        :param cache_size: number of `get` results to remember
+        """
+        self.blob = blob
+        self.offsets = offsets
+        self.none_id = none_id
+        self._cached_find = functools.lru_cache(maxsize=cache_size)(self._find)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        if index == self.none_id:
+            return None
+        return str(self.blob[self.offsets[index]:self.offsets[index + 1]], 'utf8', 'surrogatepass')
+
+    def _find(self, string):
+        index = bisect.bisect_left(self, string)
+        if index == len(self) or self[index] != string:
+            return None
+        return index
+
+    def get(self, string, default=None):
+        index = self._cached_find(string) if type(string) is str else None
+        return default if index is None else index
+
+
+class CompactTrie(_CompiledSearch):
+    """
+    frozen, read-only copy of an AhoCorasickReplace trie, stored in flat arrays instead of one dict per node
+    nodes are numbered breadth-first with children sorted by token,
+    so the children of a node are the contiguous node ids [first_child[node], first_child[node + 1])
+    tokens and replacements are interned, and failure links are included so that translate and find_all are linear
+    build with `AhoCorasickReplace.freeze()`, or `CompactTrie.load()` a file written by `save()`
+    nothing is modified after it is built (apart from caching decoded strings), so it can be shared by many threads
+    """
+
+    __slots__ = ('tokenizer', 'fold', 'tokens', 'token_ids', 'replacements', 'node_token', 'first_child', 'node_value',
+                 'fail', 'depth', 'output', '_mmap')
+
+    def __init__(self, trie):
+        """
+        :type trie: AhoCorasickReplace
+        """
+        self.tokenizer = trie.tokenizer
+        self.fold = trie.fold
+        self._mmap = None
+
+        # intern tokens, sorted so that sorting children by token id also sorts them by token
+        tokens = set()
+        nodes = [trie.head]
+        while nodes:
+            node = nodes.pop(-1)
+            tokens.update(node.keys())
+            nodes.extend(node.values())
+        self.tokens = sorted(tokens)
+        self.token_ids = {token: token_id for token_id, token in enumerate(self.tokens)}
+
+        # number the nodes breadth-first
+        self.replacements = []
+        value_ids = dict()  # {(type, value): value_id} for hashable values
+        self.node_token = array.array('i', [-1])  # token on the edge into each node (the root has none)
+        self.first_child = array.array('I')
+        self.node_value = array.array('i')  # index into replacements, or -1
+        nodes = collections.deque([trie.head])
+        while nodes:
+            node = nodes.popleft()
+            self.first_child.append(len(self.node_token))
+            for token_id, token in sorted((self.token_ids[token], token) for token in node.keys()):
+                self.node_token.append(token_id)
+                nodes.append(node[token])
+
+            if node.REPLACEMENT is _SENTINEL:
+                self.node_value.append(-1)
+                continue
+            try:
+                value_id = value_ids.setdefault((type(node.REPLACEMENT), node.REPLACEMENT), len(self.replacements))
+            except TypeError:  # unhashable values are not interned
+                value_id = len(self.replacements)
+            if value_id == len(self.replacements):
+                self.replacements.append(node.REPLACEMENT)
+            self.node_value.append(value_id)
+        self.first_child.append(len(self.node_token))
+
+        # failure and output links, also breadth-first
+        num_nodes = len(self.node_token)
+        self.fail = array.array('i', [0]) * num_nodes
+        self.depth = array.array('I', [0]) * num_nodes
+        self.output = array.array('i', [-1]) * num_nodes  # the root never matches, even if '' is a key
+        for state in range(num_nodes):
+            for child in range(self.first_child[state], self.first_child[state + 1]):
+                self.depth[child] = self.depth[state] + 1
+                if state:
+                    fallback = self.fail[state]
+                    target = self._find_child(fallback, self.node_token[child])
+                    while target < 0 and fallback:
+                        fallback = self.fail[fallback]
+                        target = self._find_child(fallback, self.node_token[child])
+                    self.fail[child] = max(target, 0)
+                if self.node_value[child] >= 0:
+                    self.output[child] = child
+                else:
+                    self.output[child] = self.output[self.fail[child]]
+
+    def _find_child(self, state, token_id):
+        lo = self.first_child[state]
+        hi = self.first_child[state + 1]
+        index = bisect.bisect_left(self.node_token, token_id, lo, hi)
+        if index < hi and self.node_token[index] == token_id:
+            return index
+        return -1
+
+    def _find(self, key):
+        state = 0
+        for token in self.tokenizer(key):
+            if self.fold is not None:
+                token = self.fold(token)
+            token_id = self.token_ids.get(token)
+            if token_id is None:
+                return -1
+            state = self._find_child(state, token_id)
+            if state < 0:
+                return -1
+        return state
+
+    def _stepper(self):
+        token_ids = self.token_ids
+        node_token = self.node_token
+        first_child = self.first_child
+        fail = self.fail
+        bisect_left = bisect.bisect_left
+
+        def step(state, token):
+            token_id = token_ids.get(token)
+            if token_id is None:
+                return 0
+            while True:
+                lo = first_child[state]
+                hi = first_child[state + 1]
+                index = bisect_left(node_token, token_id, lo, hi)
+                if index < hi and node_token[index] == token_id:
+                    return index
+                if not state:
+                    return 0
+                state = fail[state]
+
+        return step
+
+    def _replacement(self, state):
+        return self.replacements[self.node_value[state]]
+
+    def __contains__(self, key):
+        state = self._find(key)
+        return state >= 0 and self.node_value[state] >= 0
+
+    def _item_slice(self, start, stop, step=None):
+        """
+        (key, value) pairs for keys in [start, stop), skipping subtrees that are out of range
+        """
+        tokens = self.tokens
+        node_token = self.node_token
+        first_child = self.first_child
+        node_value = self.node_value
+        return [(key, self.replacements[node_value[state]])
+                for key, state in _iter_key_range(0,
+                                                  lambda state: [(tokens[node_token[child]], child) for child in
+                                                                 range(first_child[state], first_child[state + 1])],
+                                                  lambda state: node_value[state] >= 0,
+                                                  start, stop)][::step]
+
+    def __getitem__(self, key):
+        if type(key) is slice:
+            return [value for key, value in self._item_slice(key.start, key.stop, key.step)]
+        state = self._find(key)
+        if state < 0 or self.node_value[state] < 0:
+            raise KeyError(key)
+        return self.replacements[self.node_value[state]]
+
+    def items(self):
+        tokens = self.tokens
+        node_token = self.node_token
+        first_child = self.first_child
+        node_value = self.node_value
+        replacements = self.replacements
+
+        _path = []
+        _stack = [(first_child[0], first_child[1])]  # ranges of child nodes left to visit
+        while _stack:
+            lo, hi = _stack.pop(-1)
+            if lo < hi:
+                _stack.append((lo + 1, hi))
+                _path.append(tokens[node_token[lo]])
+                if node_value[lo] >= 0:
+                    yield ''.join(_path), replacements[node_value[lo]]
+                _stack.append((first_child[lo], first_child[lo + 1]))
+            elif _path:
+                _path.pop(-1)
+            else:
+                assert not _stack
+
+    def keys(self):
+        for key, value in self.items():
+            yield key
+
+    def values(self):
+        for key, value in self.items():
+            yield value
+
+    def stats(self):
+        """
+        same as AhoCorasickReplace.stats
+        bytes_per_node counts the per-node arrays (including failure links), not the tokens and replacements
+        :rtype: dict
+        """
+        first_child = self.first_child
+        node_value = self.node_value
+        depth = self.depth
+        num_nodes = len(self.node_token)
+        num_keys = total_key_depth = 0
+        branching = collections.Counter()
+        for node in range(num_nodes):
+            branching[first_child[node + 1] - first_child[node]] += 1
+            if node_value[node] >= 0:
+                num_keys += 1
+                total_key_depth += depth[node]
+        total_bytes = sum(getattr(self, name).itemsize * len(getattr(self, name)) for name, _ in _COMPACT_ARRAYS)
+        return _trie_stats(num_nodes, num_keys, max(depth), total_key_depth, branching, total_bytes)
+
+    def to_regex(self, fix_spaces=True, fix_quotes=True, fix_fffd=True):
+        tokens = self.tokens
+        node_token = self.node_token
+        first_child = self.first_child
+        node_value = self.node_value
+        return _to_regex(0,
+                         lambda node: [(tokens[node_token[child]], child)
+                                       for child in range(first_child[node], first_child[node + 1])],
+                         lambda node: node_value[node] >= 0,
+                         fix_spaces=fix_spaces, fix_quotes=fix_quotes, fix_fffd=fix_fffd)
+
+    def to_regex_shards(self, max_size=65536, flags=0, fix_spaces=True, fix_quotes=True, fix_fffd=True):
+        """
+        same as AhoCorasickReplace.to_regex_shards
+        :rtype: list[re.Pattern]
+        """
+        tokens = self.tokens
+        node_token = self.node_token
+        first_child = self.first_child
+        node_value = self.node_value
+        return _to_regex_shards(0,
+                                lambda node: [(tokens[node_token[child]], child)
+                                              for child in range(first_child[node], first_child[node + 1])],
+                                lambda node: node_value[node] >= 0,
+                                max_size=max_size, flags=flags,
+                                fix_spaces=fix_spaces, fix_quotes=fix_quotes, fix_fffd=fix_fffd)
+
+    def save(self, path):
+        """
+        write to a versioned binary file, which `CompactTrie.load` memory-maps instead of reading
+        tokens must be strings, and replacements must be strings or None
+        the tokenizer is not saved, so pass the same one to `load`
+        :param path: output file path
+        """
+        for token in self.tokens:
+            if type(token) is not str:
+                raise TypeError('only string tokens can be saved, got %r' % type(token))
+        none_id = -1
+        for value_id, replacement in enumerate(self.replacements):
+            if replacement is None:
+                none_id = value_id
+            elif type(replacement) is not str:
+                raise TypeError('only string (or None) replacements can be saved, got %r' % type(replacement))
+
+        def strings_table(strings):
+            encoded = [b'' if string is None else string.encode('utf8', 'surrogatepass') for string in strings]
+            offsets = array.array('Q', [0])
+            for string in encoded:
+                offsets.append(offsets[-1] + len(string))
+            return offsets.tobytes(), b''.join(encoded)
+
+        sections = [array.array(typecode, getattr(self, name)).tobytes() for name, typecode in _COMPACT_ARRAYS]
+        sections.extend(strings_table(self.tokens))
+        sections.extend(strings_table(self.replacements))
+
+        with io.open(path, mode='wb') as f:
+            f.write(_COMPACT_HEADER.pack(_COMPACT_MAGIC, _COMPACT_VERSION, _COMPACT_BYTE_ORDER,
+                                         len(self.node_value), len(self.tokens), len(self.replacements), none_id))
+            for section in sections:
+                f.write(b'\x00' * (_align(f.tell()) - f.tell()))
+                f.write(section)
+
+    @classmethod
+    def load(cls, path, tokenizer=None, fold=None):
+        """
+        memory-map a file written by `save`, read-only
+        loading takes constant time, and processes that load the same file share its pages
+        :param path: file written by `save`
+        :param tokenizer: same tokenizer as the saved trie (None to iterate over the input, like AhoCorasickReplace)
+        :param fold: same fold function as the saved trie (the saved keys are already folded)
+        :rtype: CompactTrie
+        """
+        with io.open(path, mode='rb') as f:
+            _mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(_mmap) < _COMPACT_HEADER.size:
+            raise ValueError('not a saved CompactTrie: %s' % path)
+        magic, version, byte_order, num_nodes, num_tokens, num_replacements, none_id = \
+            _COMPACT_HEADER.unpack_from(_mmap)
+        if magic != _COMPACT_MAGIC:
+            raise ValueError('not a saved CompactTrie: %s' % path)
+        if version != _COMPACT_VERSION:
+            raise ValueError('unsupported CompactTrie file version %d (expected %d)' % (version, _COMPACT_VERSION))
+        if byte_order != _COMPACT_BYTE_ORDER:
+            raise ValueError('CompactTrie file was saved on a machine with a different byte order')
+
+        buffer = memoryview(_mmap)
+        offset = _COMPACT_HEADER.size
+
+        def section(length, typecode='B'):
+            nonlocal offset
+            start = _align(offset)
+            offset = start + length * struct.calcsize(typecode)
+            if offset > len(buffer):
+                raise ValueError('truncated CompactTrie file: %s' % path)
+            return buffer[start:offset].cast(typecode)
+
+        self = cls.__new__(cls)
+        self.tokenizer = tokenizer if tokenizer is not None else _iterate_tokens
+        self.fold = fold
+        self._mmap = _mmap
+        for name, typecode in _COMPACT_ARRAYS:
+            setattr(self, name, section(num_nodes + (name == 'first_child'), typecode))
+        token_offsets = section(num_tokens + 1, 'Q')
+        self.tokens = self.token_ids = _MappedStrings(section(token_offsets[-1]), token_offsets)
+        replacement_offsets = section(num_replacements + 1, 'Q')
+        self.replacements = _MappedStrings(section(replacement_offsets[-1]), replacement_offsets, none_id)
+        return self
+
+
+# trie used by process_tree workers, set by _init_translate_worker
+_WORKER_TRIE = None
+
+
+def _init_translate_worker(trie, tokenizer=None):
+    """
+    multiprocessing pool initializer for process_tree
+    with the fork start method the trie is inherited (copy-on-write), never pickled
+    a path to a saved CompactTrie is memory-mapped instead, so all workers share the same pages
+    """
+    global _WORKER_TRIE
+    if isinstance(trie, str):
+        trie = CompactTrie.load(trie, tokenizer=tokenizer)
+    _WORKER_TRIE = trie
+
+
+def _worker_translate_file(task):
+    input_path, output_path, overwrite, encoding = task
+    t = time.time()
+    record = {'input_path':   input_path,
+              'output_path':  output_path,
+              'status':       'skipped',
+              'input_bytes':  os.path.getsize(input_path),
+              'output_bytes': 0,
+              'error':        None,
+              }
+    if overwrite or not os.path.exists(output_path):
+        try:
+            _translate_file(_WORKER_TRIE, input_path, output_path, encoding=encoding)
+            record['status'] = 'done'
+            record['output_bytes'] = os.path.getsize(output_path)
+        except Exception as e:
+            record['status'] = 'failed'
+            record['error'] = repr(e)
+    record['seconds'] = time.time() - t
+    return record
+
+
+def process_tree(trie, input_folder, output_folder, file_name_pattern='*', overwrite=False, encoding='utf8',
+                 processes=None, tokenizer=None, start_method=None, chunksize=1):
+    """
+    translate every file in a folder tree with a process pool, into the same relative paths under output_folder
+    each file is written to a .partial file and renamed when complete, with the same output as `process_path`
+    yields one progress record per file (in order of completion), e.g.
+        {'input_path': ..., 'output_path': ..., 'status': 'done' | 'skipped' | 'failed', 'error': None,
+         'input_bytes': 123, 'output_bytes': 120, 'seconds': 0.01,
+         'files_done': 1, 'files_total': 10, 'bytes_done': 123, 'bytes_total': 4567, 'elapsed': 0.02, 'mb_per_s': 6.2}
+    failures are reported in the records instead of raised, so one bad file doesn't stop the rest
+    :param trie: AhoCorasickReplace, AhoCorasickAutomaton or CompactTrie (inherited by forked workers, not copied),
+                 or the path of a file written by `save()`, which each worker memory-maps (best for spawn/forkserver)
+    :param input_folder: folder (or glob) to crawl
+    :param output_folder: where to write the translated files
+    :param file_name_pattern: fnmatch pattern for file names
+    :param overwrite: re-translate files whose output already exists
+    :param encoding: file encoding
+    :param processes: number of worker processes (default: cpu count)
+    :param tokenizer: tokenizer for a trie given as a path
+    :param start_method: 'fork', 'spawn', 'forkserver', or None for the platform default
+    :param chunksize: number of files sent to a worker at a time
+    """
+    input_folder = os.path.abspath(input_folder)
+    output_folder = os.path.abspath(output_folder)
+    tasks = [(path, os.path.join(output_folder, os.path.relpath(path, input_folder)), overwrite, encoding)
+             for path in crawl(input_folder, file_name_pattern) if os.path.isfile(path)]
+    bytes_total = sum(os.path.getsize(task[0]) for task in tasks)
+
+    files_done = 0
+    bytes_done = 0
+    t = time.time()
+    ctx = multiprocessing.get_context(start_method)
+    with ctx.Pool(processes, initializer=_init_translate_worker, initargs=(trie, tokenizer)) as pool:
+        for record in pool.imap_unordered(_worker_translate_file, tasks, chunksize=chunksize):
+            files_done += 1
+            bytes_done += record['input_bytes']
+            elapsed = time.time() - t
+            record.update({'files_done':  files_done,
+                           'files_total': len(tasks),
+                           'bytes_done':  bytes_done,
+                           'bytes_total': bytes_total,
+                           'elapsed':     elapsed,
+                           'mb_per_s':    bytes_done / 1e6 / elapsed if elapsed else 0.0,
+                           })
+            yield record
+
+
+def translate_texts(trie, texts, threads=None, chunksize=64):
+    """
+    translate many strings with a thread pool, yielding the translated strings in the same order as `texts`
+    an AhoCorasickReplace is frozen first, because only the read-only versions are safe to share between threads
+    only scales with threads on free-threaded builds (elsewhere the GIL runs one thread at a time),
+    but unlike process_tree there is no process startup or pickling
+    :param trie: AhoCorasickReplace, AhoCorasickAutomaton or CompactTrie
+    :param texts: iterable of strings
+    :param threads: number of threads (default: cpu count)
+    :param chunksize: number of texts per task
+    """
+    if isinstance(trie, AhoCorasickReplace):
+        trie = trie.freeze()
+
+    def translate_chunk(chunk):
+        return [''.join(trie.translate(trie.tokenizer(text))) for text in chunk]
+
+    text_iterator = iter(texts)
+    chunks = iter(lambda: list(itertools.islice(text_iterator, chunksize)), [])  # until an empty chunk
+    for translated in _threaded_map(translate_chunk, chunks, threads):
+        yield from translated
+
+
+def _threaded_map(func, items, threads=None):
+    """
+    like ThreadPoolExecutor.map, but with at most 2 tasks per thread submitted at a time,
+    so that items are only read as results are taken (instead of all up front) and few results are held at once
+    results are yielded in the same order as items
+    :param threads: number of threads (default: cpu count)
+    """
+    threads = threads or os.cpu_count()
+    with concurrent.futures.ThreadPoolExecutor(threads) as executor:
+        futures = collections.deque()
+        try:
+            for item in items:
+                if len(futures) >= 2 * threads:
+                    yield futures.popleft().result()
+                futures.append(executor.submit(func, item))
+            while futures:
+                yield futures.popleft().result()
+        finally:
+            for future in futures:  # if the caller stops early, don't run what is left
+                future.cancel()
 
 
 def self_test():
@@ -737,6 +2336,52 @@ def self_test():
         print('#python2.7 use_gazeteer.py')
         raise
 
+    # regex tokenizers must match the char-by-char ones exactly
+    _text = 'The  quick\t\tbrown fox,,  aged 12 (twelve)\u00a0\u00a0jumps\u2026 over\n\nthe lazy dog!!\ufffd' * 3
+    for _max_len in (1, 2, 5, 65535):
+        assert list(char_group_tokenize(_text, _max_len)) == list(_char_group_tokenize_chars(_text, _max_len))
+        for _emit_space in (True, False):
+            for _emit_punc in (True, False):
+                assert list(space_tokenize(_text, _max_len, _emit_space, _emit_punc)) == \
+                       list(_space_tokenize_chars(_text, _max_len, _emit_space, _emit_punc))
+
+    # re-cutting blocks only cuts at token boundaries, carrying runs without one over as many blocks as needed
+    assert list(_cut_at_token_boundaries(['aa', 'aa', 'a.', 'b', ' ', ' ', 'c'])) == ['aaaaa.', 'b  ', 'c']
+    assert list(_cut_at_token_boundaries(['a', 'b', ''])) == ['ab']
+
+    # reading a file in blocks must not change the tokens
+    _fd, _path = tempfile.mkstemp(suffix='.txt')
+    with io.open(_fd, mode='w', encoding='utf8') as _f:
+        _f.write(_text)
+    try:
+        for _tokenizer in (None, space_tokenize, char_group_tokenize):
+            _trie = AhoCorasickReplace(_tokenizer)
+            for _block_size in (1, 7, 1048576):
+                assert list(_trie._yield_tokens(_path, block_size=_block_size)) == list(_trie.tokenizer(_text))
+    finally:
+        os.remove(_path)
+
+    # streaming in small chunks carries partial matches and tokens over, so the output is the same as translate
+    class _Writer(io.BytesIO):
+        async def drain(self):
+            pass
+
+    async def _translate_stream(_trie, _data, _read_size):
+        _reader = asyncio.StreamReader()
+        _reader.feed_data(_data)
+        _reader.feed_eof()
+        _writer = _Writer()
+        await _trie.translate_stream(_reader, _writer, read_size=_read_size)
+        return _writer.getvalue().decode('utf8')
+
+    for _tokenizer in (None, space_tokenize, char_group_tokenize):
+        _trie = AhoCorasickReplace(_tokenizer)
+        _trie.update([('April 2018', '<date>'), ('the quick', '\u26a1'), ('fox', 'f\u00f6x'), ('x', 'y')], verbose=False)
+        for _read_size in (1, 5, 65536):
+            for _stream_text in (_text, 'fox' * 5000 + ' fox.'):  # the second has one long token
+                assert asyncio.run(_translate_stream(_trie, _stream_text.encode('utf8'), _read_size)) == \
+                       ''.join(_trie.translate(_trie.tokenizer(_stream_text)))
+
     # feed in a list of tuples
     _trie = AhoCorasickReplace()
     _trie.update([('asd', '111'), ('hjk', '222'), ('dfgh', '3333'), ('ghjkl;', '44444'), ('jkl', '!')])
@@ -745,6 +2390,13 @@ def self_test():
     assert ''.join(_trie.translate('erassdfghjkl;jkl;')) == 'erass3333!;!;'
     assert ''.join(_trie.translate('ersdfghjkll')) == 'ers3333!l'
 
+    # the compiled automaton must give the same output
+    _automaton = _trie.compile()
+    assert ''.join(_automaton.translate('erasdfghjkll')) == 'er111fg222ll'
+    assert ''.join(_automaton.translate('erasdfghjkl;jkl;')) == 'er111f44444!;'
+    assert ''.join(_automaton.translate('erassdfghjkl;jkl;')) == 'erass3333!;!;'
+    assert ''.join(_automaton.translate('ersdfghjkll')) == 'ers3333!l'
+
     # test regex
     permutations = []
     for a in 'abcde':
@@ -769,6 +2421,13 @@ def self_test():
     _trie.update(x.split('.') for x in 'a.b b.c c.d d.a'.split())
     assert ''.join(_trie.translate('acbd')) == 'bdca'
 
+    # bulk building gives the same trie
+    _pairs = [('asd', '111'), ('hjk', '222'), ('dfgh', '3333'), ('ghjkl;', '44444'), ('jkl', '!'), ('as', '0')]
+    _trie = AhoCorasickReplace().bulk_update(_pairs, verbose=False)
+    assert list(_trie.items()) == list(AhoCorasickReplace().update(_pairs, verbose=False).items())
+    assert list(_trie.items()) == list(AhoCorasickReplace().bulk_update(_pairs, sort=True, verbose=False).items())
+    assert ''.join(_trie.translate('erasdfghjkll')) == 'er111fg222ll'
+
     # feed in a dict
     _trie = AhoCorasickReplace()
     _trie.update({
@@ -787,6 +2446,41 @@ def self_test():
     assert ''.join(_trie.translate('a' * 25)) == '~3'
     assert ''.join(_trie.translate('a' * 60)) == '~~772'
 
+    _automaton = _trie.compile()
+    assert ''.join(_automaton.translate('a' * 12 + 'b' + 'a' * 28)) == '732b~33'
+    assert ''.join(_automaton.translate('a' * 40)) == '~773a'
+    assert ''.join(_automaton.translate('a' * 45)) == '~~a'
+    assert ''.join(_automaton.translate('a' * 25)) == '~3'
+    assert ''.join(_automaton.translate('a' * 60)) == '~~772'
+
+    _compact = _trie.freeze()
+    assert ''.join(_compact.translate('a' * 12 + 'b' + 'a' * 28)) == '732b~33'
+    assert ''.join(_compact.translate('a' * 40)) == '~773a'
+    assert ''.join(_compact.translate('a' * 60)) == '~~772'
+    assert 'aaaaaaa' in _compact and 'aaaa' not in _compact and 'c' not in _compact
+    assert _compact['bbbb'] == '!'
+    assert list(_compact.items()) == list(_trie.items())
+    assert _compact.to_regex() == _trie.to_regex()
+
+    # round trip through a memory-mapped file
+    _fd, _path = tempfile.mkstemp(suffix='.trie')
+    os.close(_fd)
+    try:
+        _trie.save(_path)
+        _mapped = CompactTrie.load(_path)
+        assert ''.join(_mapped.translate('a' * 12 + 'b' + 'a' * 28)) == '732b~33'
+        assert 'aaaaaaa' in _mapped and 'aaaa' not in _mapped and 'c' not in _mapped
+        assert list(_mapped.items()) == list(_trie.items())
+        assert _mapped.to_regex() == _trie.to_regex()
+        del _mapped
+    finally:
+        os.remove(_path)
+
+    # mapped string lookups only remember a bounded number of results, whether they were found or not
+    _strings = _MappedStrings(b'abbc', [0, 1, 3, 4], cache_size=2)
+    assert [_strings.get(string) for string in ('a', 'bb', 'c', 'x', 'a', 'y')] == [0, 1, 2, None, 0, None]
+    assert _strings._cached_find.cache_info().currsize == 2
+
     del _trie['bbbb']
     assert 'b' not in _trie.head
 
@@ -808,6 +2502,29 @@ def self_test():
     del _trie['aaa':'bbb']
     assert _trie.to_regex() == 'aa'
 
+    # range queries and range deletes only touch the subtrees in range, and leave no empty nodes behind
+    _trie = AhoCorasickReplace.fromkeys(permutations[:500])
+    _expected = [key for key in sorted(permutations[:500]) if 'aba' <= key < 'abd']
+    assert _trie['aba':'abd'] == [''] * len(_expected)
+    assert [key for key, value in _trie.freeze()._item_slice('aba', 'abd')] == _expected
+    assert len(_trie[:]) == 500
+    del _trie['aba':'abd']
+    assert not any(key in _trie for key in _expected)
+    assert len(list(_trie.keys())) == 500 - len(_expected)
+    assert sorted(_trie.head['a']['b'].keys()) == ['d', 'e']
+    try:
+        _trie.pop('abzzz')
+    except KeyError:
+        pass
+    assert 'z' not in _trie.head['a']['b']
+
+    # sharded regexes cover each key exactly once, and a single shard is the same as to_regex
+    _trie = AhoCorasickReplace.fromkeys(permutations[:500])
+    assert [shard.pattern for shard in _trie.to_regex_shards(max_size=10 ** 6)] == [_trie.to_regex()]
+    _shards = _trie.to_regex_shards(max_size=200)
+    assert len(_shards) > 1 and all(len(shard.pattern) <= 200 for shard in _shards)
+    assert all(sum(1 for shard in _shards if shard.fullmatch(key)) == 1 for key in permutations[:500])
+
     _trie = AhoCorasickReplace.fromkeys('mad gas scar madagascar scare care car career error err are'.split())
 
     test = 'madagascareerror'
@@ -815,10 +2532,97 @@ def self_test():
     assert list(_trie.find_all(test, True)) == \
            ['mad', 'gas', 'madagascar', 'scar', 'car', 'scare', 'care', 'are', 'career', 'err', 'error']
 
+    assert [(m.start, m.end, test[m.char_start:m.char_end]) for m in _trie.finditer(test)] == \
+           [(0, 10, 'madagascar'), (11, 16, 'error')]
+    assert [test[m.char_start:m.char_end] for m in _trie.finditer(test, True)] == list(_trie.find_all(test, True))
+
+    _automaton = _trie.compile()
+    assert list(_automaton.find_all(test)) == ['madagascar', 'error']
+    assert list(_automaton.find_all(test, True)) == \
+           ['mad', 'gas', 'madagascar', 'scar', 'car', 'scare', 'care', 'are', 'career', 'err', 'error']
+
+    # case and unicode folding: matches ignore case and curly quotes, unmatched text keeps its original form
+    _trie = AhoCorasickReplace(fold=fold_unicode)
+    _trie['dont  stop'] = 'X'
+    _trie["Isn't"] = 'Y'
+    test = 'DONT\u00a0 Stop, isn\u2019T. Dont go'
+    assert ''.join(_trie.translate(test)) == 'X, Y. Dont go'
+    assert list(_trie.find_all(test)) == ['DONT\u00a0 Stop', 'isn\u2019T']
+    assert 'dONt  sTOP' in _trie and list(_trie.keys()) == ['dont  stop', "isn't"]
+    assert list(_trie.compile().finditer(test)) == list(_trie.freeze().finditer(test)) == list(_trie.finditer(test))
+    assert list(translate_texts(_trie, [test, 'dont stop', ''] * 50, threads=4, chunksize=7)) == \
+           ['X, Y. Dont go', 'dont stop', ''] * 50
+
+    # translate_texts streams: an endless input is only read a few chunks ahead of the output
+    _drawn = itertools.count()
+    _texts = ('dont  stop %d' % next(_drawn) for _ in itertools.count())
+    assert list(itertools.islice(translate_texts(_trie, _texts, threads=2, chunksize=10), 25)) == \
+           ['X %d' % index for index in range(25)]
+    assert next(_drawn) <= 10 * (2 * 2 + 3)
+
+    # bytes mode: same translation on the encoded text, with unchanged parts passed through as memoryview slices
+    _trie = AhoCorasickReplace.fromkeys(['caf\u00e9', 'caf'], default='\u2615')
+    _automaton = _trie.compile(encoding='utf8')
+    test = 'un caf\u00e9, deux cafs'
+    _chunks = list(_automaton.translate_buffer(test.encode('utf8')))
+    assert b''.join(_chunks).decode('utf8') == ''.join(_trie.translate(test)) == 'un \u2615, deux \u2615s'
+    assert type(_chunks[0]) is memoryview
+    assert [(m.start, m.end) for m in _automaton.finditer_buffer(bytearray(test.encode('utf8')))] == [(3, 8), (15, 18)]
+    _trie['deux'] = None
+    try:
+        _trie.compile(encoding='utf8')
+    except ValueError as e:
+        assert "'deux'" in str(e)
+    else:
+        raise AssertionError('None replacements should be rejected in bytes mode')
+    try:
+        _translate_file(_trie, __file__, __file__ + '.out', encoding=None)
+    except ValueError as e:
+        assert 'compile(encoding=' in str(e)
+    else:
+        raise AssertionError('encoding=None should need an automaton compiled with an encoding')
+    assert not os.path.exists(__file__ + '.out.partial')
+
+    # compare the automaton and compact trie against the trie on random overlapping keys
+    for _ in range(200):
+        _trie = AhoCorasickReplace()
+        _trie.update(((''.join(random.choice('ab') for _ in range(random.randint(1, 6))), random.choice(['x', 'yy', '']))
+                      for _ in range(random.randint(1, 8))), verbose=False)
+        _automaton = _trie.compile()
+        _compact = _trie.freeze()
+        assert list(_compact.items()) == list(_trie.items())
+        _stats = _trie.stats()
+        assert _stats['num_keys'] == len(list(_trie.keys()))
+        assert {key: value for key, value in _compact.stats().items() if key != 'bytes_per_node'} == \
+               {key: value for key, value in _stats.items() if key != 'bytes_per_node'}
+        for _ in range(5):
+            test = ''.join(random.choice('ab') for _ in range(random.randint(0, 30)))
+            assert list(_automaton.translate(test)) == list(_trie.translate(test))
+            assert list(_automaton.find_all(test)) == list(_trie.find_all(test))
+            assert list(_automaton.find_all(test, True)) == list(_trie.find_all(test, True))
+            assert list(_compact.translate(test)) == list(_trie.translate(test))
+            assert list(_compact.find_all(test, True)) == list(_trie.find_all(test, True))
+            assert list(_automaton.finditer(test)) == list(_trie.finditer(test))
+            assert list(_compact.finditer(test, True)) == list(_trie.finditer(test, True))
+
 
 if __name__ == '__main__':
     self_test()
 
+    # regex tokenizers vs the char-by-char versions on a few MB of text
+    sample_text = 'It was 1 April 2018, and the quick brown fox jumped over the lazy dogs again.\n' * 50000
+    for fast_tokenizer, slow_tokenizer in [(space_tokenize, _space_tokenize_chars),
+                                           (char_group_tokenize, _char_group_tokenize_chars)]:
+        assert list(fast_tokenizer(sample_text)) == list(slow_tokenizer(sample_text))
+        t_slow = time.time()
+        list(slow_tokenizer(sample_text))
+        t_slow = time.time() - t_slow
+        t_fast = time.time()
+        list(fast_tokenizer(sample_text))
+        t_fast = time.time() - t_fast
+        print('%s on %s: %s -> %s (%.1fx)' % (fast_tokenizer.__name__, format_bytes(len(sample_text)),
+                                              format_seconds(t_slow), format_seconds(t_fast), t_slow / t_fast))
+
     # define input/output
     input_folder = os.path.abspath('./regex_datetime')
     output_folder = os.path.abspath('./temp')
@@ -835,12 +2639,12 @@ if __name__ == '__main__':
 
     # set tokenizer
     trie = AhoCorasickReplace(space_tokenize)
-    trie.update(mapping, verbose=True)
+    trie.bulk_update(mapping, verbose=True)
 
     # no tokenizer is better if you want to build a regex
     # no tokenizer matches and replaces any substring, not just words
     trie2 = AhoCorasickReplace()
-    trie2.update(mapping, verbose=True)
+    trie2.bulk_update(mapping, verbose=True)
 
     m_end = psutil.virtual_memory().used
     t_end = datetime.datetime.now()
@@ -851,11 +2655,15 @@ if __name__ == '__main__':
     t_init = datetime.datetime.now()
     print('processing start...', t_init)
 
-    # process everything using the same tokenizer
-    for path in crawl(input_folder, file_name_pattern):
-        if os.path.isfile(path):
-            new_path = path.replace(input_folder, output_folder)
-            trie.process_path(path, new_path, overwrite=True)
+    # process everything using the same tokenizer, one file per worker process at a time
+    for progress in process_tree(trie, input_folder, output_folder, file_name_pattern, overwrite=True):
+        print('[%d/%d] %s %s (%s of %s, %.2f MB/s)' % (progress['files_done'], progress['files_total'],
+                                                      progress['status'], progress['input_path'],
+                                                      format_bytes(progress['bytes_done']),
+                                                      format_bytes(progress['bytes_total']),
+                                                      progress['mb_per_s']))
+        if progress['error'] is not None:
+            print('    %s' % progress['error'])
 
     # stop timer
     t_end = datetime.datetime.now()
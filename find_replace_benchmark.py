@@ -0,0 +1,248 @@
+import datetime
+import io
+import json
+import os
+import platform
+import random
+import re
+import sys
+import time
+import tracemalloc
+
+from find_replace import AhoCorasickReplace
+from find_replace import format_bytes
+from find_replace import format_seconds
+from find_replace import space_tokenize
+
+# dictionary sizes to benchmark, 10 ** 7 keys needs tens of GB of RAM in the dict-backed trie
+SIZES = [10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6, 10 ** 7]
+
+# 'words': keys are 1 to 3 words matched as whole tokens (space_tokenize)
+# 'chars': keys are single words matched anywhere (default tokenizer, one token per char)
+MODES = ['words', 'chars']
+
+# key syllables are lowercase and filler syllables are uppercase, so filler text never matches a key
+KEY_SYLLABLES = [consonant + vowel for consonant in 'bcdfghjklmnprstvwz' for vowel in 'aeiou']
+FILLER_SYLLABLES = [syllable.upper() for syllable in KEY_SYLLABLES]
+
+
+def _pseudo_word(rng, syllables, min_syllables=2, max_syllables=4):
+    return ''.join(rng.choice(syllables) for _ in range(rng.randint(min_syllables, max_syllables)))
+
+
+def make_dictionary(num_keys, mode, seed=0):
+    """
+    synthetic (key, replacement) pairs, the same for the same arguments
+    :param num_keys: number of distinct keys
+    :param mode: 'words' or 'chars'
+    :rtype: list[(str, str)]
+    """
+    rng = random.Random(seed)
+    keys = set()
+    if mode == 'words':
+        vocabulary = [_pseudo_word(rng, KEY_SYLLABLES) for _ in range(max(100, min(num_keys, 100000)))]
+        while len(keys) < num_keys:
+            keys.add(' '.join(rng.choice(vocabulary) for _ in range(rng.randint(1, 3))))
+    elif mode == 'chars':
+        while len(keys) < num_keys:
+            keys.add(_pseudo_word(rng, KEY_SYLLABLES, 2, 5))
+    else:
+        raise ValueError('unknown mode: %r' % mode)
+    return [(key, key.upper()) for key in sorted(keys)]
+
+
+def make_text(pairs, num_chars=1000000, hit_rate=0.1, seed=0):
+    """
+    synthetic text: filler words, with a dictionary key in place of about hit_rate of them
+    :type pairs: list[(str, str)]
+    :rtype: str
+    """
+    rng = random.Random(seed)
+    words = []
+    size = 0
+    while size < num_chars:
+        if rng.random() < hit_rate:
+            words.append(rng.choice(pairs)[0])
+        else:
+            words.append(_pseudo_word(rng, FILLER_SYLLABLES, 1, 3))
+        size += len(words[-1]) + 1
+    return ' '.join(words)
+
+
+def _throughput(num_chars, seconds):
+    return num_chars / 1e6 / max(seconds, 1e-9)
+
+
+def benchmark(num_keys, mode, text_chars=1000000, max_regex_keys=10 ** 5, trace_memory=True, seed=0):
+    """
+    build time and peak memory, translate / find_all throughput, and to_regex compile and match time
+    compared against re.sub with the generated regex
+    tracemalloc slows everything down, so memory is measured in a separate build from the timed one
+    :param num_keys: dictionary size
+    :param mode: 'words' or 'chars'
+    :param text_chars: size of the text to search
+    :param max_regex_keys: skip the regex measurements (None in the output) for bigger dictionaries
+    :param trace_memory: measure peak memory during the build with tracemalloc
+    :rtype: dict
+    """
+    tokenizer = space_tokenize if mode == 'words' else None
+    pairs = make_dictionary(num_keys, mode, seed=seed)
+    text = make_text(pairs, num_chars=text_chars, seed=seed)
+    result = {'mode':       mode,
+              'num_keys':   num_keys,
+              'key_chars':  sum(len(key) for key, replacement in pairs),
+              'text_chars': len(text),
+              }
+
+    # build, timed
+    t = time.perf_counter()
+    trie = AhoCorasickReplace(tokenizer).bulk_update(pairs, verbose=False)
+    result['build_seconds'] = time.perf_counter() - t
+    result['build_keys_per_second'] = num_keys / max(result['build_seconds'], 1e-9)
+    result['trie_stats'] = trie.stats()
+
+    # build again, traced
+    result['build_peak_bytes'] = None
+    if trace_memory:
+        tracemalloc.start()
+        try:
+            AhoCorasickReplace(tokenizer).bulk_update(pairs, verbose=False)
+            result['build_peak_bytes'] = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    # search and replace
+    t = time.perf_counter()
+    translated = ''.join(trie.translate(trie.tokenizer(text)))
+    result['translate_mb_per_s'] = _throughput(len(text), time.perf_counter() - t)
+
+    t = time.perf_counter()
+    result['num_matches'] = sum(1 for _ in trie.find_all(text))
+    result['find_all_mb_per_s'] = _throughput(len(text), time.perf_counter() - t)
+
+    t = time.perf_counter()
+    automaton = trie.compile()
+    result['compile_seconds'] = time.perf_counter() - t
+    t = time.perf_counter()
+    ''.join(automaton.translate(automaton.tokenizer(text)))
+    result['compiled_translate_mb_per_s'] = _throughput(len(text), time.perf_counter() - t)
+    del automaton
+
+    # regex equivalent
+    for name in ['regex_chars', 'to_regex_seconds', 'regex_compile_seconds', 'regex_findall_mb_per_s',
+                 're_sub_mb_per_s', 're_sub_same_output']:
+        result[name] = None
+    if num_keys <= max_regex_keys:
+        t = time.perf_counter()
+        pattern = trie.to_regex(fix_spaces=False, fix_quotes=False, fix_fffd=False)
+        result['to_regex_seconds'] = time.perf_counter() - t
+        if mode == 'words':
+            pattern = r'\b(?:%s)\b' % pattern  # only whole words, like space_tokenize
+        result['regex_chars'] = len(pattern)
+
+        t = time.perf_counter()
+        regex = re.compile(pattern)
+        result['regex_compile_seconds'] = time.perf_counter() - t
+
+        t = time.perf_counter()
+        regex.findall(text)
+        result['regex_findall_mb_per_s'] = _throughput(len(text), time.perf_counter() - t)
+
+        mapping = dict(pairs)
+        t = time.perf_counter()
+        substituted = regex.sub(lambda match: mapping[match.group()], text)
+        result['re_sub_mb_per_s'] = _throughput(len(text), time.perf_counter() - t)
+        result['re_sub_same_output'] = substituted == translated
+
+    return result
+
+
+def run_benchmarks(sizes=SIZES, modes=MODES, text_chars=1000000, max_regex_keys=10 ** 5, trace_memory=True,
+                   seed=0, verbose=True):
+    """
+    benchmark every size in every mode
+    :rtype: list[dict]
+    """
+    results = []
+    for mode in modes:
+        for num_keys in sizes:
+            result = benchmark(num_keys, mode, text_chars=text_chars, max_regex_keys=max_regex_keys,
+                               trace_memory=trace_memory, seed=seed)
+            if verbose:
+                print_result(result)
+            results.append(result)
+    return results
+
+
+def print_result(result):
+    print('%s, %d keys:' % (result['mode'], result['num_keys']))
+    print('    build:     %s (%d keys per second)' % (format_seconds(result['build_seconds']),
+                                                        result['build_keys_per_second']))
+    print('    nodes:     %d (%.1f bytes each, %.1f tokens per key)' % (result['trie_stats']['num_nodes'],
+                                                                     result['trie_stats']['bytes_per_node'],
+                                                                     result['trie_stats']['mean_depth']))
+    if result['build_peak_bytes'] is not None:
+        print('    peak mem:  %s (%.1f bytes per key char)' % (format_bytes(result['build_peak_bytes']),
+                                                                result['build_peak_bytes'] / result['key_chars']))
+    print('    translate: %.2f MB/s (compiled: %.2f MB/s)' % (result['translate_mb_per_s'],
+                                                               result['compiled_translate_mb_per_s']))
+    print('    find_all:  %.2f MB/s (%d matches)' % (result['find_all_mb_per_s'], result['num_matches']))
+    if result['regex_chars'] is not None:
+        print('    regex:     %s chars, built in %s, compiled in %s' % (result['regex_chars'],
+                                                                      format_seconds(result['to_regex_seconds']),
+                                                                      format_seconds(result['regex_compile_seconds'])))
+        print('    findall:   %.2f MB/s, re.sub: %.2f MB/s (same output: %s)' % (result['regex_findall_mb_per_s'],
+                                                                               result['re_sub_mb_per_s'],
+                                                                               result['re_sub_same_output']))
+
+
+def save_results(results, path):
+    """
+    write results as a JSON baseline, with enough about the machine to tell baselines apart
+    """
+    with io.open(path, mode='w', encoding='utf8') as f:
+        json.dump({'timestamp': datetime.datetime.now().isoformat(),
+                   'python':    sys.version,
+                   'platform':  platform.platform(),
+                   'processor': platform.processor(),
+                   'cpu_count': os.cpu_count(),
+                   'results':   results,
+                   }, f, indent=4)
+
+
+def compare_results(results, baseline_path):
+    """
+    print each numeric measurement as a ratio of the baseline (for the same mode and number of keys)
+    higher is better for per-second measurements, lower is better for everything else
+    :return: {(mode, num_keys): {name: ratio}}
+    """
+    with io.open(baseline_path, mode='r', encoding='utf8') as f:
+        baseline = {(result['mode'], result['num_keys']): result for result in json.load(f)['results']}
+
+    ratios = dict()
+    for result in results:
+        old_result = baseline.get((result['mode'], result['num_keys']))
+        if old_result is None:
+            continue
+        ratios[result['mode'], result['num_keys']] = dict()
+        print('%s, %d keys vs baseline:' % (result['mode'], result['num_keys']))
+        for name, value in result.items():
+            old_value = old_result.get(name)
+            if name in ('num_keys', 'key_chars', 'text_chars'):
+                continue
+            if type(value) not in (int, float) or type(old_value) not in (int, float) or not old_value:
+                continue
+            ratios[result['mode'], result['num_keys']][name] = value / old_value
+            print('    %-28s %.2fx' % (name, value / old_value))
+    return ratios
+
+
+if __name__ == '__main__':
+    # the biggest sizes take a long time and a lot of memory, so start small
+    baseline_path = os.path.abspath('find_replace_benchmark.json')
+    benchmark_results = run_benchmarks(sizes=[10 ** 3, 10 ** 4, 10 ** 5])
+    if os.path.exists(baseline_path):
+        compare_results(benchmark_results, baseline_path)
+    else:
+        save_results(benchmark_results, baseline_path)
+        print('baseline saved to %s' % baseline_path)
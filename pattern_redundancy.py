@@ -0,0 +1,215 @@
+import collections
+import io
+import random
+import string
+import sys
+import time
+
+try:
+    from re import _parser as sre_parse  # python 3.11+
+except ImportError:
+    import sre_parse
+
+from regex_datetime import REGEX_PATTERNS_PARSERS
+from regex_datetime import get_extractor
+
+# characters to pick from for character classes, plus any literal characters in the class itself
+_CHAR_POOL = string.ascii_letters + string.digits + string.punctuation + ' '
+
+_CATEGORIES = {
+    sre_parse.CATEGORY_DIGIT:     lambda char: char.isdigit(),
+    sre_parse.CATEGORY_NOT_DIGIT: lambda char: not char.isdigit(),
+    sre_parse.CATEGORY_SPACE:     lambda char: char.isspace(),
+    sre_parse.CATEGORY_NOT_SPACE: lambda char: not char.isspace(),
+    sre_parse.CATEGORY_WORD:      lambda char: char.isalnum() or char == '_',
+    sre_parse.CATEGORY_NOT_WORD:  lambda char: not (char.isalnum() or char == '_'),
+}
+
+
+def _in_set(items, char):
+    negate = False
+    for op, av in items:
+        if op is sre_parse.NEGATE:
+            negate = True
+        elif op is sre_parse.LITERAL and chr(av) == char:
+            return not negate
+        elif op is sre_parse.RANGE and av[0] <= ord(char) <= av[1]:
+            return not negate
+        elif op is sre_parse.CATEGORY and _CATEGORIES[av](char):
+            return not negate
+    return negate
+
+
+def _random_string(parsed, rng):
+    """
+    a random string from a parsed regex (lookarounds and boundaries are skipped, so check the result with fullmatch)
+    """
+    out = []
+    for op, av in parsed:
+        if op is sre_parse.LITERAL:
+            out.append(chr(av))
+        elif op is sre_parse.NOT_LITERAL:
+            out.append(rng.choice([char for char in _CHAR_POOL if ord(char) != av]))
+        elif op is sre_parse.ANY:
+            out.append(rng.choice(_CHAR_POOL))
+        elif op is sre_parse.IN:
+            pool = set(_CHAR_POOL)
+            pool.update(chr(av) for op, av in av if op is sre_parse.LITERAL)
+            out.append(rng.choice(sorted(char for char in pool if _in_set(av, char))))
+        elif op is sre_parse.BRANCH:
+            out.append(_random_string(rng.choice(av[1]), rng))
+        elif op is sre_parse.SUBPATTERN:
+            out.append(_random_string(av[-1], rng))
+        elif op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT):
+            min_repeat, max_repeat, item = av
+            for _ in range(rng.randint(min_repeat, min(max_repeat, min_repeat + 2))):
+                out.append(_random_string(item, rng))
+        elif op not in (sre_parse.AT, sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+            raise ValueError(f'unsupported regex op: {op}')
+    return ''.join(out)
+
+
+def structural_containment(config=None, num_samples=200, seed=0):
+    """
+    which labels' patterns (probably) match everything another label's pattern matches, without any corpus:
+    random strings are generated from each pattern, and other patterns are checked for whether they fullmatch all of them
+    :param config: ExtractorConfig, or None for the defaults
+    :param num_samples: strings generated per label
+    :return: {label: set of other labels that matched all its samples}
+    :rtype: dict[str, set[str]]
+    """
+    extractor = get_extractor(config)
+    rng = random.Random(seed)
+    out = dict()
+    for label in REGEX_PATTERNS_PARSERS:
+        parsed = sre_parse.parse(extractor.regex_formatted[label])
+        regex = extractor.regex_compiled[label]
+        samples = set()
+        for _ in range(num_samples * 10):
+            sample = _random_string(parsed, rng)
+            if regex.fullmatch(sample):
+                samples.add(sample)
+            if len(samples) >= num_samples:
+                break
+        out[label] = set(other for other in REGEX_PATTERNS_PARSERS
+                         if other != label and samples and
+                         all(extractor.regex_compiled[other].fullmatch(sample) for sample in samples))
+    return out
+
+
+def empirical_containment(lines, config=None):
+    """
+    for every pair of labels, how many matches of the first were also found with the same span by the second,
+    or inside a longer match of the second (so `regex_text` would drop it)
+    :param lines: iterable of strings
+    :param config: ExtractorConfig, or None for the defaults
+    :return: ({label: num_matches}, {(label, other): num_same_span}, {(label, other): num_inside})
+    """
+    extractor = get_extractor(config)
+    num_matches = collections.Counter()
+    same_span = collections.Counter()
+    inside = collections.Counter()
+    for line in lines:
+        spans = [(regex_label, m.start(), m.end()) for regex_label, m in extractor.find_matches(' '.join(line.split()))
+                 if regex_label in REGEX_PATTERNS_PARSERS]
+        for label, start, end in spans:
+            num_matches[label] += 1
+            same = set()
+            longer = set()
+            for other, other_start, other_end in spans:
+                if other == label:
+                    continue
+                if (other_start, other_end) == (start, end):
+                    same.add(other)
+                elif other_start <= start and end <= other_end:
+                    longer.add(other)
+            same_span.update((label, other) for other in same)
+            inside.update((label, other) for other in longer - same)
+    return num_matches, same_span, inside
+
+
+def find_redundant_patterns(lines, config=None, num_samples=200, min_matches=10, seed=0):
+    """
+    pairs of labels where the first looks redundant given the second, either structurally or empirically:
+    STRUCTURAL is 'identical' if both patterns matched all of each other's samples, 'subset' if only the second did,
+    and MATCHES/SAME_SPAN/INSIDE are counted from the corpus (only reported if SAME_SPAN + INSIDE == MATCHES)
+    :param lines: iterable of strings
+    :param config: ExtractorConfig, or None for the defaults
+    :param num_samples: strings generated per label for the structural check
+    :param min_matches: fewest matches in the corpus to call a label empirically redundant
+    :rtype: list[dict]
+    """
+    structural = structural_containment(config, num_samples=num_samples, seed=seed)
+    num_matches, same_span, inside = empirical_containment(lines, config=config)
+
+    out = []
+    for label in REGEX_PATTERNS_PARSERS:
+        for other in REGEX_PATTERNS_PARSERS:
+            if other == label:
+                continue
+            if other in structural[label]:
+                relation = 'identical' if label in structural[other] else 'subset'
+            else:
+                relation = None
+            covered = same_span[label, other] + inside[label, other]
+            if relation is None and (num_matches[label] < min_matches or covered < num_matches[label]):
+                continue
+            out.append({'LABEL':      label,
+                        'OTHER':      other,
+                        'STRUCTURAL': relation,
+                        'MATCHES':    num_matches[label],
+                        'SAME_SPAN':  same_span[label, other],
+                        'INSIDE':     inside[label, other],
+                        })
+    return out
+
+
+def scan_reduction(lines, config=None, repeat=3):
+    """
+    scans per line with one regex per label versus one per shape group (see `regex_datetime.shape_groups`),
+    and the time taken to find all matches in the lines both ways (best of `repeat`)
+    :rtype: dict
+    """
+    extractor = get_extractor(config)
+    lines = [' '.join(line.split()) for line in lines]
+    label_seconds = []
+    shape_seconds = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        for line in lines:
+            [(regex_label, m) for regex_label, regex_obj in extractor.regex_compiled.items()
+             for m in regex_obj.finditer(line)]
+        label_seconds.append(time.perf_counter() - t)
+
+        t = time.perf_counter()
+        for line in lines:
+            extractor.find_matches(line)
+        shape_seconds.append(time.perf_counter() - t)
+
+    return {'SCANS_PER_LABEL': len(extractor.regex_compiled),
+            'SCANS_PER_SHAPE': len(extractor.regex_scans),
+            'MERGED':          [[regex_label for regex_label, group_index in labels]
+                                for regex, labels in extractor.regex_scans if len(labels) > 1],
+            'LABEL_SECONDS':   min(label_seconds),
+            'SHAPE_SECONDS':   min(shape_seconds),
+            }
+
+
+if __name__ == '__main__':
+    SOURCE_FILES = sys.argv[1:] or ['regex_datetime_test.txt', 'README.md']
+    corpus_lines = []
+    for path in SOURCE_FILES:
+        with io.open(path, mode='r', encoding='utf8') as f:
+            corpus_lines.extend(f.readlines())
+
+    print('%-24s %-24s %-10s %8s %10s %8s' % ('LABEL', 'OTHER', 'STRUCTURAL', 'MATCHES', 'SAME_SPAN', 'INSIDE'))
+    for row in find_redundant_patterns(corpus_lines):
+        print('%-24s %-24s %-10s %8d %10d %8d' % (row['LABEL'], row['OTHER'], row['STRUCTURAL'] or '-',
+                                                 row['MATCHES'], row['SAME_SPAN'], row['INSIDE']))
+
+    reduction = scan_reduction(corpus_lines)
+    print()
+    for labels in reduction['MERGED']:
+        print('one scan for:', ', '.join(labels))
+    print('scans per line: %d -> %d' % (reduction['SCANS_PER_LABEL'], reduction['SCANS_PER_SHAPE']))
+    print('find all matches: %.3fs -> %.3fs' % (reduction['LABEL_SECONDS'], reduction['SHAPE_SECONDS']))
@@ -1,31 +1,49 @@
+import collections
+import concurrent.futures
 import csv
+import datetime
+import heapq
 import io
+import itertools
+import math
+import multiprocessing
 import os
+import random
 import re
+import statistics
+import tempfile
+import threading
+import time
+import types
 import warnings
 
 import dateutil.parser
 
+# month and day names per language, used to build the 'B' and 'A' regex parts
+MONTH_NAMES = {
+    'en': ('JAN', 'JANUARY', 'FEB', 'FEBRUARY', 'MAR', 'MARCH', 'APR', 'APRIL', 'MAY', 'JUN', 'JUNE',
+           'JUL', 'JULY', 'AUG', 'AUGUST', 'SEP', 'SEPT', 'SEPTEMBER', 'OCT', 'OCTOBER', 'NOV', 'NOVEMBER',
+           'DEC', 'DECEMBER'),
+    'ms': ('JAN', 'JANUARI', 'DJAN', 'DJANUARI', 'DJANUARY', 'FEB', 'FEBRUARI', 'PEB', 'PEBRUARI', 'PEBRUARY',
+           'MAC', 'MAR', 'MARET', 'MRT', 'APR', 'APRIL', 'MEI', 'MAI', 'JUN', 'JUNI', 'DJUN', 'DJUNI',
+           'JUL', 'JULAI', 'JULI', 'DJUL', 'DJULI', 'OG', 'OGOS', 'AG', 'AGT', 'AGUSTUS', 'AGTUSTUS',
+           'SEP', 'SEPT', 'SEPTEMBER', 'OKT', 'OKTOBER', 'NOV', 'NOP', 'NOVEMBER', 'NOPEMBER',
+           'DES', 'DESEMBER', 'DIS', 'DISEMBER', 'DIC', 'DICEMBER'),
+}
+DAY_NAMES = {
+    'en': ('MON', 'MONDAY', 'TUE', 'TUES', 'TUESDAY', 'WED', 'WEDNESDAY', 'THU', 'THURS', 'THURSDAY',
+           'FRI', 'FRIDAY', 'SAT', 'SATURDAY', 'SUN', 'SUNDAY'),
+    'ms': ('ISN', 'ISNIN', 'ISNEN', 'SEN', 'SENIN', 'SENEN', 'SEL', 'SELASA', 'RAB', 'RABU',
+           'KA', 'KAM', 'KAMIS', 'KHA', 'KHAM', 'KHAMIS', 'JUM', 'JUMAT', 'JUMMT', 'JUMAAT', 'JUMMAT',
+           'SAB', 'SABTU', 'AHD', 'AHAD', 'MIN', 'MINGGU'),
+}
+
 REGEX_PARTS = {
 
-    'Y':       r"(?:19[4-9]\d|20[0-3]\d)",  # 1940 to 2039
+    # 'Y' (year window), 'B' (month names) and 'A' (day names) depend on the ExtractorConfig
     'y':       r"(?:\d\d)",  # 00 to 99
     'm':       r"(?:1[012]|0?[1-9])",  # 0?1 to 12
     'mz':      r"(?:1[012]|0[1-9])",  # 01 to 12
-    'B':       r"(?:"
-               r"D?JAN(?:UAR[IY])?|"
-               r"[FP]EB(?:RUAR[IY])?|"
-               r"MAC|MAR(?:CH|ET)?|MRT|"
-               r"APR(?:IL)?|"
-               r"M[EA]I|MAY|"
-               r"JUNE?|D?JUNI?|"
-               r"JUL(?:Y|AI)?|D?JULI?|"
-               r"OG(?:OS)?|AUG(?:UST)?|AGT?(?:USTUS)?|"
-               r"SEP(?:T(?:EMBER)?)?|"
-               r"O[KC]T(?:OBER)?|"
-               r"NO[VP](?:EMBER)?|"
-               r"D[EI][SC](?:EMBER)?"
-               r")",
     'd':       r"(?:3[01]|[12]\d|0?[1-9])",  # 0?1 to 31
     'd_range': r"(?:3[01]|[12]\d|0?[1-9])(?: ?[-] ?(?:3[01]|[12]\d|0?[1-9]))?",  # 14-15
     'dz':      r"(?:3[01]|[12]\d|0[1-9])",  # 01 to 31
@@ -51,15 +69,6 @@ REGEX_PARTS = {
                r"T)|V(?:ET|LAT|O(?:LT|ST)|UT)|W(?:A(?:KT|ST|T)|E(?:ST|T)|IT|ST)|Y(?:AKT|"
                r"EKT))",  # FROM: en.wikipedia.org/wiki/List_of_time_zone_abbreviations
     'z':       r"(?:[+-](?:0\d|1[0-4]):?(?:00|15|30|45))",  # [+-] 00:00 to 14:45
-    'A':       r"(?:"
-               r"MON(?:DAY)?|(?:IS|SE)N(?:[IE]N)?|"
-               r"TUE(?:S(?:DAY)?)?|SEL(?:ASA)?|"
-               r"WED(?:NESDAY)?|RABU?|"
-               r"THU(?:RS(?:DAY)?)?|KH?A(?:M(?:IS)?)?|"
-               r"FRI(?:DAY)?|JUM(?:[AM]A?T)?|"
-               r"SAT(?:URDAY)?|SAB(?:TU)?|"
-               r"SUN(?:DAY)?|AHA?D|MIN(?:GGU)?"
-               r")",
     'th':      r"(?:ST|ND|RD|TH|º)",
 }
 REGEX_PATTERNS_PARSERS = {
@@ -177,9 +186,7 @@ REGEX_PATTERNS_PARSERS = {
     # # 910814094500 (9:45am)
     # 'yy_mm_dd_HH_MM_SS':     r"(?:{y}{mz}{dz}{H}{M}{S})",  # too many phone numbers
 
-    # 1991-08-14T09:45:00Z
-    'YYYY_mm_dd_HH_MM':      r"(?:{Y}[-]{m}[-]{d}[T ]{H}:{M}(?: ?(?:Z|{Z}|{z}))?)",
-    'YYYY_mm_dd_HH_MM_SS_1': r"(?:{Y}[-]{m}[-]{d}[T ]{H}:{M}:{S}(?: ?(?:Z|{Z}|{z}))?)",
+    # 19910814T094500Z (1991-08-14T09:45:00Z is composed from its date and time, see COMPOSED_LABELS)
     'YYYY_mm_dd_HH_MM_SS_2': r"(?:{Y}{mz}{d}T?{H}{M}{S}(?: ?(?:Z|{Z}|{z}))?)",
 
     # # standalone
@@ -189,22 +196,21 @@ REGEX_PATTERNS_PARSERS = {
     # 'timezone':              r"(?:Z|{Z}|{z})",  # too many malay words
 }
 
-#  unicode fixes
-REGEX_FORMATTED = {label: '\\b' +
-                          pattern
-                              .format(**REGEX_PARTS)  # fill in the chunks
-                              .replace("-]", "\u2009\u2010\u2011\u2012\u2013\u2014-]")  # unicode dashes
-                              .replace("'?", "['\u2018\u2019]?")  # unicode quotes
-                          + '\\b'
-                   for label, pattern in REGEX_PATTERNS_PARSERS.items()}
+# datetimes composed from a date match followed by a time match, instead of scanning for each combination
+# {(date label, time label): datetime label}
+COMPOSED_LABELS = {
+    ('YYYY_mm_dd_3', 'HH_MZ_pp_1'): 'YYYY_mm_dd_HH_MM',  # 1991-08-14 09:45
+    ('YYYY_mm_dd_3', 'HH_MM_SS'):   'YYYY_mm_dd_HH_MM_SS_1',  # 1991-08-14T09:45:00Z
+}
+COMPOSED_SEPARATORS = ('T', ' ', ' at ')  # between the date and the time, case-insensitive
+_DATE_END = r'(?:\b|(?=T\d))'  # dates that get composed can also end at the T in 1991-08-14T09:45
 
 # match emails and urls to avoid returning chunks of them
-REGEX_FORMATTED['eml'] = r'''[a-zA-Z0-9][^\s`!@%$^={}\[\]/\\"',()<>:;]+(?:@|%40|\s+at\s+|\s*<\s*at\s*>\s*)[a-zA-Z0-9][-_a-zA-Z0-9~.]+\.[a-zA-Z]{2,15}'''
-REGEX_FORMATTED['url'] = r'\b(?:(?:https?|ftp|file)://|www\d?\.|ftp\.)[-A-Z0-9+&@#/%=~_|$?!:,.]*[A-Z0-9+&@#/%=~_|$]'
-REGEX_FORMATTED['dot'] = r'(?:\d+\.){3,}\d+'
-
-# compile all the regex patterns
-REGEX_COMPILED = {label: re.compile(pattern, flags=re.I | re.U) for label, pattern in REGEX_FORMATTED.items()}
+REGEX_IGNORED = {
+    'eml': r'''[a-zA-Z0-9][^\s`!@%$^={}\[\]/\\"',()<>:;]+(?:@|%40|\s+at\s+|\s*<\s*at\s*>\s*)[a-zA-Z0-9][-_a-zA-Z0-9~.]+\.[a-zA-Z]{2,15}''',
+    'url': r'\b(?:(?:https?|ftp|file)://|www\d?\.|ftp\.)[-A-Z0-9+&@#/%=~_|$?!:,.]*[A-Z0-9+&@#/%=~_|$]',
+    'dot': r'(?:\d+\.){3,}\d+',
+}
 
 HEADERS = ['PATH',
            'FILE_ID',
@@ -219,19 +225,548 @@ HEADERS = ['PATH',
            'PARSED',
            ]
 
+# year_min/year_max: 4-digit year window matched by `Y`
+# century_start: 2-digit years resolve to [century_start, century_start + 99], or None to let dateutil decide
+# dayfirst: default for ambiguous numeric dates
+# languages: which MONTH_NAMES / DAY_NAMES to match
+ExtractorConfig = collections.namedtuple('ExtractorConfig',
+                                         ['year_min', 'year_max', 'century_start', 'dayfirst', 'languages'],
+                                         defaults=(1940, 2039, None, True, ('en', 'ms')))
+
+# numeric fields that get generalized when grouping patterns by shape (see `pattern_shape`)
+SHAPE_FIELDS = {'y': 'n', 'm': 'n', 'mz': 'n', 'd': 'n', 'dz': 'n', 'j': 'n', 'H': 'n', 'HZ': 'n', 'I': 'n',
+                'M': 'n', 'S': 'n', 'Y': 'n4'}
+SHAPE_PARTS = {'n': r"(?:\d{1,3})", 'n4': r"(?:\d{4})"}  # matches everything the fields above match
+
+
+def _regex_char_range(lo, hi):
+    if lo == hi:
+        return lo
+    if (lo, hi) == ('0', '9'):
+        return r'\d'
+    return '[%s-%s]' % (lo, hi)
+
+
+def _regex_digit_range(lo, hi):
+    """
+    regex alternatives matching all digit strings between lo and hi (inclusive)
+    :param lo: digit string, same length as hi
+    :param hi: digit string
+    :rtype: list[str]
+    """
+    assert len(lo) == len(hi) and lo <= hi
+    if len(lo) == 1 or (lo[1:] == '0' * (len(lo) - 1) and hi[1:] == '9' * (len(hi) - 1)):
+        return [_regex_char_range(lo[0], hi[0]) + r'\d' * (len(lo) - 1)]
+    if lo[0] == hi[0]:
+        return [lo[0] + part for part in _regex_digit_range(lo[1:], hi[1:])]
+
+    # split into [lo, x999], [x+1 000, y-1 999], [y000, hi]
+    parts = [lo[0] + part for part in _regex_digit_range(lo[1:], '9' * (len(lo) - 1))]
+    if int(hi[0]) - int(lo[0]) > 1:
+        parts.append(_regex_char_range(str(int(lo[0]) + 1), str(int(hi[0]) - 1)) + r'\d' * (len(lo) - 1))
+    parts.extend(hi[0] + part for part in _regex_digit_range('0' * (len(hi) - 1), hi[1:]))
+    return parts
+
+
+def _regex_words(words):
+    # longest first, so the alternation prefers the longest word like a greedy optional suffix would
+    return '(?:%s)' % '|'.join(sorted(set(words), key=lambda word: (-len(word), word)))
+
+
+def _format_pattern(pattern, regex_parts, start='\\b', end='\\b'):
+    return (start +
+            pattern
+                .format(**regex_parts)  # fill in the chunks
+                .replace("-]", "\u2009\u2010\u2011\u2012\u2013\u2014-]")  # unicode dashes
+                .replace("'?", "['\u2018\u2019]?")  # unicode quotes
+            + end)
+
+
+def pattern_shape(pattern):
+    """
+    a pattern from REGEX_PATTERNS_PARSERS with its numeric fields generalized (see SHAPE_FIELDS)
+    e.g. `{d}/{m}/{Y}` and `{m}/{d}/{Y}` are both `{n}/{n}/{n4}`
+    :rtype: str
+    """
+    return re.sub(r'{(\w+)}', lambda m: '{%s}' % SHAPE_FIELDS.get(m.group(1), m.group(1)), pattern)
+
+
+def shape_groups():
+    """
+    labels of REGEX_PATTERNS_PARSERS grouped by pattern_shape, each group is found by one scan
+    dates in COMPOSED_LABELS have a different boundary, so they are scanned on their own
+    :rtype: list[list[str]]
+    """
+    composed = set(date_label for date_label, time_label in COMPOSED_LABELS)
+    groups = dict()
+    for label, pattern in REGEX_PATTERNS_PARSERS.items():
+        groups.setdefault(label if label in composed else pattern_shape(pattern), []).append(label)
+    return list(groups.values())
+
+
+def _is_longest(m, others):
+    """
+    whether every other match is inside m or doesn't touch it (touching matches must be inside m)
+    """
+    return all((other.start() >= m.start() and other.end() <= m.end()) or
+               other.start() > m.end() or
+               other.end() < m.start()
+               for other in others)
+
+
+class _GroupMatch(object):
+    """
+    one label's group in a match of a merged scan, with the parts of the re.Match interface used here
+    """
+
+    __slots__ = ('match', 'group_index')
+
+    def __init__(self, match, group_index):
+        self.match = match
+        self.group_index = group_index
+
+    def start(self):
+        return self.match.start(self.group_index)
+
+    def end(self):
+        return self.match.end(self.group_index)
+
+    def group(self):
+        return self.match.group(self.group_index)
+
+
+class _ComposedMatch(object):
+    """
+    a date match and the time match after it, as one match with the parts of the re.Match interface used here
+    """
+
+    __slots__ = ('date_match', 'time_match')
+
+    def __init__(self, date_match, time_match):
+        self.date_match = date_match
+        self.time_match = time_match
+
+    def start(self):
+        return self.date_match.start()
+
+    def end(self):
+        return self.time_match.end()
+
+    def group(self):
+        return self.date_match.string[self.date_match.start():self.time_match.end()]
+
+
+class _WindowedParserInfo(dateutil.parser.parserinfo):
+    """
+    resolves 2-digit years into a fixed 100-year window instead of dateutil's "within 50 years of today"
+    """
+
+    def __init__(self, century_start, dayfirst=False):
+        super(_WindowedParserInfo, self).__init__(dayfirst=dayfirst)
+        self.century_start = century_start
+
+    def convertyear(self, year, century_specified=False):
+        if year < 100 and not century_specified:
+            year += self.century_start - self.century_start % 100
+            if year < self.century_start:
+                year += 100
+        return year
+
+
+class _QuietParser(dateutil.parser.parser):
+    """
+    leaves out timezone names that dateutil doesn't know (the datetime stays naive) without an UnknownTimezoneWarning,
+    so that parsing doesn't need warnings.catch_warnings, which changes process-wide state and is not thread-safe
+    """
+
+    def _build_tzaware(self, naive, res, tzinfos):
+        # the only case where dateutil warns, and it returns the naive datetime after warning
+        if res.tzname and res.tzoffset is None and not tzinfos and res.tzname not in time.tzname:
+            return naive
+        return super(_QuietParser, self)._build_tzaware(naive, res, tzinfos)
+
+
+# labels with a fixed year, month, day[, hour, minute[, second]] digit order, parsed without dateutil
+ISO_LABELS = frozenset(label for label in list(REGEX_PATTERNS_PARSERS) + list(COMPOSED_LABELS.values())
+                       if label.startswith('YYYY_mm_dd_'))
+_COMPOSED_PARTS = {datetime_label: labels for labels, datetime_label in COMPOSED_LABELS.items()}
+_COMPOSED_BY_DATE = {date_label: [(time_label, datetime_label)
+                                   for (other_label, time_label), datetime_label in COMPOSED_LABELS.items()
+                                   if other_label == date_label]
+                     for date_label, time_label in COMPOSED_LABELS}
+_LABEL_ORDER = tuple(REGEX_PATTERNS_PARSERS) + tuple(COMPOSED_LABELS.values()) + tuple(REGEX_IGNORED)
+_LABEL_RANK = {regex_label: index for index, regex_label in enumerate(_LABEL_ORDER)}
+_ISO_NUM_FIELDS = {'YYYY_mm_dd_HH_MM': 5, 'YYYY_mm_dd_HH_MM_SS_1': 6, 'YYYY_mm_dd_HH_MM_SS_2': 6}  # default is 3
+_ISO_COMPACT_SLICES = ((0, 4), (4, 6), (6, 8), (8, 10), (10, 12), (12, 14))  # YYYYmmddHHMMSS
+_DIGIT_RUNS = re.compile(r'[0-9]+')
+_NEEDS_DATEUTIL = object()
+_ANY_DIGIT = re.compile(r'\d')
+
+
+def parse_iso_batch(regex_labels, matched_texts, dayfirst=True):
+    """
+    bulk-parse matches of ISO_LABELS straight from their digits, skipping dateutil
+    gives the same results as dateutil, including its dayfirst quirk (2018-03-12 is read as 3 Dec)
+    anything with a timezone or an ambiguous run of digits is left for dateutil
+    :param regex_labels: labels from ISO_LABELS
+    :param matched_texts: matched text for each label
+    :param dayfirst: same as for dateutil
+    :return: date / datetime for each text, None if invalid, or _NEEDS_DATEUTIL if it must go through dateutil
+    :rtype: list
+    """
+    findall = _DIGIT_RUNS.findall
+    out = []
+    for regex_label, matched_text in zip(regex_labels, matched_texts):
+        fields = findall(matched_text)
+
+        # compact forms: 19910814, 19910814094500, 19910814T094500
+        if len(fields) == 2 and len(fields[0]) == 8 and len(fields[1]) == 6 and matched_text[8] == 'T':
+            fields = [fields[0] + fields[1]]
+        if len(fields) == 1 and len(fields[0]) in (8, 14):
+            fields = [fields[0][start:end] for start, end in _ISO_COMPACT_SLICES[:len(fields[0]) // 2 - 1]]
+
+        # timezones, unicode digits or dashes, and odd digit runs go to dateutil
+        if (len(fields) != _ISO_NUM_FIELDS.get(regex_label, 3) or matched_text[-1] not in '0123456789' or
+                not matched_text.isascii()):
+            out.append(_NEEDS_DATEUTIL)
+            continue
+
+        year, month, day = int(fields[0]), int(fields[1]), int(fields[2])
+        if dayfirst and day <= 12:
+            month, day = day, month  # dateutil reads Y-D-M if dayfirst and the last number could be a month
+        try:
+            if len(fields) == 3:
+                out.append(datetime.date(year, month, day))
+            else:
+                out.append(datetime.datetime(year, month, day, *map(int, fields[3:])))
+        except ValueError:
+            out.append(None)
+    return out
+
+
+def _clean_time(matched_text):
+    # dateutil doesn't understand `hrs`, `MN` (midnight) or `NN` (noon), or `.` or ` ` between hours and minutes
+    matched_text = re.sub(r'H(?:(?:OU)?RS?)?', '', matched_text, flags=re.I)
+    matched_text = re.sub(r'MN', r'AM', matched_text, flags=re.I)
+    matched_text = re.sub(r'NN', r'PM', matched_text, flags=re.I)
+    return re.sub(r'(\d)[. ](\d)', r'\1:\2', matched_text)
+
 
 def parse_txt(path):
     with io.open(path, mode='r', encoding='utf8') as f:
         return os.path.basename(path), f.readlines()
 
 
-def regex_text(text, longest=True, context_max_len=999, dayfirst=True):
-    # join multiple spaces, convert tabs, strip leading/trailing whitespace
-    text = ' '.join(text.split())
-    matches = []
+class DatetimeExtractor(object):
+    """
+    compiled regex patterns and dateutil parser for one ExtractorConfig
+    use `get_extractor` instead of creating these directly, so the compiled patterns get reused
+    """
+
+    __slots__ = ('config', 'regex_parts', 'regex_formatted', 'regex_compiled', 'regex_composed', 'regex_scans',
+                 '_regex_any', '_parser')
+
+    def __init__(self, config):
+        """
+        :type config: ExtractorConfig
+        """
+        self.config = config
+
+        self.regex_parts = dict(REGEX_PARTS)
+        self.regex_parts['Y'] = '(?:%s)' % '|'.join(_regex_digit_range(str(config.year_min), str(config.year_max)))
+        self.regex_parts['B'] = _regex_words(word for lang in config.languages for word in MONTH_NAMES[lang])
+        self.regex_parts['A'] = _regex_words(word for lang in config.languages for word in DAY_NAMES[lang])
+
+        #  unicode fixes
+        self.regex_formatted = {label: _format_pattern(pattern, self.regex_parts)
+                                for label, pattern in REGEX_PATTERNS_PARSERS.items()}
+        for date_label, time_label in COMPOSED_LABELS:
+            self.regex_formatted[date_label] = _format_pattern(REGEX_PATTERNS_PARSERS[date_label], self.regex_parts,
+                                                               end=_DATE_END)
+        self.regex_formatted.update(REGEX_IGNORED)
+
+        # compile all the regex patterns
+        self.regex_compiled = {label: re.compile(pattern, flags=re.I | re.U)
+                               for label, pattern in self.regex_formatted.items()}
+
+        # times to match right after a date and a separator, with no word boundary needed before them
+        self.regex_composed = {time_label: re.compile(_format_pattern(REGEX_PATTERNS_PARSERS[time_label],
+                                                                      self.regex_parts, start=''), flags=re.I | re.U)
+                               for date_label, time_label in COMPOSED_LABELS}
+
+        # one scan per shape group: a lookahead for the general shape finds candidate positions,
+        # then a capturing lookahead per label finds where that label matches
+        self.regex_scans = []  # [(regex, ((regex_label, group_index), ...))]
+        shape_parts = dict(self.regex_parts, **SHAPE_PARTS)
+        for labels in shape_groups() + [[label] for label in REGEX_IGNORED]:
+            if len(labels) == 1:
+                self.regex_scans.append((self.regex_compiled[labels[0]], ((labels[0], 0),)))
+                continue
+            group_indices = []
+            num_groups = 0
+            for label in labels:
+                group_indices.append(num_groups + 1)
+                num_groups += 1 + self.regex_compiled[label].groups
+            merged = '(?=%s)%s' % (_format_pattern(pattern_shape(REGEX_PATTERNS_PARSERS[labels[0]]), shape_parts),
+                                   ''.join(f'(?:(?=({self.regex_formatted[label]}))|)' for label in labels))
+            self.regex_scans.append((re.compile(merged, flags=re.I | re.U), tuple(zip(labels, group_indices))))
+        self.regex_scans = tuple(self.regex_scans)
+        self._regex_any = None
+
+        if config.century_start is None:
+            self._parser = _QuietParser()
+        else:
+            self._parser = _QuietParser(_WindowedParserInfo(config.century_start, config.dayfirst))
+
+    def __reduce__(self):
+        # compiled regexes can't be serialized as compiled programs, so send the config instead
+        # and look it up in the receiving process's cache (compiled at most once per process)
+        return get_extractor, (self.config,)
+
+    def parse(self, regex_label, matched_text, dayfirst=None):
+        """
+        parse matched text into a date, time, or datetime (depending on the label)
+        :param regex_label: key of REGEX_PATTERNS_PARSERS
+        :param matched_text: text matched by that pattern
+        :param dayfirst: override the config's dayfirst
+        :return: datetime.date | datetime.time | datetime.datetime | None
+        """
+        if dayfirst is None:
+            dayfirst = self.config.dayfirst
+
+        if regex_label in ISO_LABELS:
+            parsed = parse_iso_batch([regex_label], [matched_text], dayfirst=dayfirst)[0]
+            if parsed is not _NEEDS_DATEUTIL:
+                return parsed
+
+        try:
+            if regex_label in _COMPOSED_PARTS:
+                # clean up the time like for the time labels, so that e.g. `10:30 hrs` parses here too
+                date_label, time_label = _COMPOSED_PARTS[regex_label]
+                date_match = self.regex_compiled[date_label].match(matched_text)
+                if date_match is not None:
+                    time_text = matched_text[date_match.end():]
+                    for separator in sorted(COMPOSED_SEPARATORS, key=len, reverse=True):
+                        if time_text[:len(separator)].lower() == separator.lower():
+                            time_text = time_text[len(separator):]
+                            break
+                    matched_text = f'{date_match.group()} {_clean_time(time_text)}'
+            if 'HH' in regex_label:
+                if 'dd' in regex_label or 'YYYY' in regex_label:
+                    matched_text = re.sub(r'[\\]', '/', matched_text)
+                    return self._parser.parse(matched_text, dayfirst=dayfirst)
+                else:
+                    matched_text = f'2001-01-01 {_clean_time(matched_text)}'
+                    return self._parser.parse(matched_text, dayfirst=dayfirst).time()
+            elif 'dd' in regex_label or 'YYYY' in regex_label:
+                matched_text = re.sub(r'[\\]', '/', matched_text)
+                return self._parser.parse(matched_text, dayfirst=dayfirst).date()
+        except ValueError:
+            pass
+
+    def parse_batch(self, regex_labels, matched_texts, dayfirst=None):
+        """
+        parse many matches at once: ISO_LABELS in bulk from their digits, everything else with dateutil
+        :param regex_labels: list of keys of REGEX_PATTERNS_PARSERS
+        :param matched_texts: list of matched text, same length
+        :param dayfirst: override the config's dayfirst
+        :rtype: list
+        """
+        if dayfirst is None:
+            dayfirst = self.config.dayfirst
+
+        out = [None] * len(regex_labels)
+        iso_indices = [index for index, regex_label in enumerate(regex_labels) if regex_label in ISO_LABELS]
+        if iso_indices:
+            iso_parsed = parse_iso_batch([regex_labels[index] for index in iso_indices],
+                                         [matched_texts[index] for index in iso_indices],
+                                         dayfirst=dayfirst)
+            for index, parsed in zip(iso_indices, iso_parsed):
+                out[index] = parsed
 
-    for regex_label, regex_obj in REGEX_COMPILED.items():
-        for m in regex_obj.finditer(text):
+        for index, (regex_label, matched_text) in enumerate(zip(regex_labels, matched_texts)):
+            if regex_label not in ISO_LABELS or out[index] is _NEEDS_DATEUTIL:
+                out[index] = self.parse(regex_label, matched_text, dayfirst=dayfirst)
+        return out
+
+    def _iter_longest(self, matches, longest=True):
+        """
+        yield (regex_label, match) pairs that are returned by regex_text, in order
+        :param matches: list of (regex_label, re.Match), including emails and urls
+        """
+        others = [other for _, other in matches]
+        for regex_label, m in matches:
+            # don't return emails or urls
+            if regex_label in REGEX_IGNORED:
+                continue
+
+            # narrow to longest match
+            if not longest or _is_longest(m, others):
+                yield regex_label, m
+
+    def _iter_longest_in_order(self, text, longest=True):
+        """
+        the same as `_iter_longest(find_matches(text))`, but lazily and ordered by start (then label),
+        so that taking only the first few matches stops the scans soon after them
+        a match is yielded once every match that starts before its end has been found, since only those can displace it
+        """
+        # every scan yields its candidates in order of start, so merge them by start
+        counter = itertools.count()  # tie-break, so that matches are never compared
+        streams = [((start, _LABEL_RANK[regex_label], next(counter), regex_label, m)
+                    for start, batch in self._iter_scan(text, regex, labels)
+                    for regex_label, m in batch)
+                   for regex, labels in self.regex_scans]
+
+        seen = []
+        pending = collections.deque()  # (regex_label, match) that might still be displaced, ordered by start
+        for start, _, _, regex_label, m in heapq.merge(*streams):
+            while pending and pending[0][1].end() < start:
+                pending_label, pending_match = pending.popleft()
+                if _is_longest(pending_match, seen):
+                    yield pending_label, pending_match
+            seen.append(m)
+            if regex_label in REGEX_IGNORED:
+                continue
+            if longest:
+                pending.append((regex_label, m))
+            else:
+                yield regex_label, m
+
+        for pending_label, pending_match in pending:
+            if _is_longest(pending_match, seen):
+                yield pending_label, pending_match
+
+    def _iter_scan(self, text, regex, labels):
+        """
+        yield (start, [(regex_label, match)]) for one of regex_scans, in order of start and then label,
+        with the composed datetimes for each date (and without dates that only matched because of a T after them)
+        """
+        next_start = [0] * len(labels)
+        for m in regex.finditer(text):
+            batch = []
+            for index, (label, group_index) in enumerate(labels):
+                # for each label, skip candidates that overlap its previous match, like its own finditer would
+                if m.start(group_index) < next_start[index]:  # -1 if this label doesn't match here
+                    continue
+                next_start[index] = m.end(group_index)
+                label_match = _GroupMatch(m, group_index) if len(labels) > 1 else m
+                if label in _COMPOSED_BY_DATE:
+                    batch.extend(self._compose(text, label_match, _COMPOSED_BY_DATE[label]))
+                    if text[label_match.end():label_match.end() + 1] in ('T', 't'):
+                        continue
+                batch.append((label, label_match))
+            if batch:
+                yield m.start(), sorted(batch, key=lambda item: _LABEL_RANK[item[0]])
+
+    def _compose(self, text, date_match, compositions):
+        """
+        (datetime_label, match) for each time right after a date and a separator
+        :param compositions: [(time_label, datetime_label)] for the date's label
+        """
+        out = []
+        date_end = date_match.end()
+        for separator in COMPOSED_SEPARATORS:
+            if text[date_end:date_end + len(separator)].lower() == separator.lower():
+                for time_label, datetime_label in compositions:
+                    time_match = self.regex_composed[time_label].match(text, date_end + len(separator))
+                    if time_match is not None:
+                        out.append((datetime_label, _ComposedMatch(date_match, time_match)))
+        return out
+
+    def find_matches(self, text):
+        """
+        every match of every pattern (including emails and urls), without dropping overlaps
+        the same as running each label's regex separately, but with one scan per shape group
+        plus a match for each date followed by a time (see COMPOSED_LABELS)
+        :param text: to be searched
+        :return: list of (regex_label, match), ordered by label then by position
+        """
+        found = dict()
+        for regex, labels in self.regex_scans:
+            if len(labels) == 1:
+                found[labels[0][0]] = regex.finditer(text)  # consumed in label order below
+                continue
+
+            # for each label, skip candidates that overlap its previous match, like its own finditer would
+            next_start = None
+            for m in regex.finditer(text):
+                if next_start is None:
+                    next_start = [0] * len(labels)
+                for index, (label, group_index) in enumerate(labels):
+                    if m.start(group_index) >= next_start[index]:  # -1 if this label doesn't match here
+                        found.setdefault(label, []).append(_GroupMatch(m, group_index))
+                        next_start[index] = m.end(group_index)
+
+        # compose datetimes from a date and the time right after it
+        for date_label, compositions in _COMPOSED_BY_DATE.items():
+            dates = list(found.get(date_label, ()))
+            for date_match in dates:
+                for datetime_label, m in self._compose(text, date_match, compositions):
+                    found.setdefault(datetime_label, []).append(m)
+
+            # dates that only matched because of the T after them aren't matches on their own
+            found[date_label] = [m for m in dates if text[m.end():m.end() + 1] not in ('T', 't')]
+
+        return [(regex_label, m) for regex_label in _LABEL_ORDER for m in found.get(regex_label, ())]
+
+    def _compile_regex_any(self):
+        # the patterns with plain boundaries, and each composed datetime as a single pattern
+        patterns = [_format_pattern(pattern, self.regex_parts) for pattern in REGEX_PATTERNS_PARSERS.values()]
+        separators = '|'.join(re.escape(separator) for separator in COMPOSED_SEPARATORS)
+        for date_label, time_label in COMPOSED_LABELS:
+            patterns.append(_format_pattern(f'{REGEX_PATTERNS_PARSERS[date_label]}(?:{separators})'
+                                            f'{REGEX_PATTERNS_PARSERS[time_label]}', self.regex_parts))
+
+        # shortest (cheapest) patterns first, since the alternation is tried in order at each position
+        return re.compile('|'.join(f'(?:{pattern})' for pattern in sorted(patterns, key=len)), flags=re.I | re.U)
+
+    def has_datetime(self, text, longest=True):
+        """
+        whether `regex_text(text, longest=longest)` would find anything, without parsing or building results
+        :param text: to be searched
+        :param longest: same as for regex_text
+        :rtype: bool
+        """
+        # join multiple spaces, convert tabs, strip leading/trailing whitespace
+        text = ' '.join(text.split())
+
+        # every pattern in REGEX_PATTERNS_PARSERS has a number in it
+        if _ANY_DIGIT.search(text) is None:
+            return False
+
+        # one pass over the text for all patterns, stopping at the first candidate
+        if self._regex_any is None:
+            self._regex_any = self._compile_regex_any()
+        if self._regex_any.search(text) is None:
+            return False
+        if not longest:
+            return True
+
+        # a candidate can still be knocked out by an overlapping match, so check it properly
+        matches = self.find_matches(text)
+        return any(True for _ in self._iter_longest(matches))
+
+    def regex_text(self, text, longest=True, context_max_len=999, dayfirst=None, limit=None, parse=True):
+        """
+        find dates and times in a line of text
+        :param text: to be searched (whitespace is normalized first)
+        :param longest: drop matches that overlap a longer match
+        :param context_max_len: max length of the CONTEXT string
+        :param dayfirst: override the config's dayfirst
+        :param limit: stop after the first this many matches (by START, instead of the usual order by label)
+        :param parse: set PARSED (otherwise it is always None)
+        """
+        # join multiple spaces, convert tabs, strip leading/trailing whitespace
+        text = ' '.join(text.split())
+        if (limit is not None and limit <= 0) or _ANY_DIGIT.search(text) is None:
+            return
+
+        if limit is None:
+            candidates = self._iter_longest(self.find_matches(text), longest=longest)
+        else:
+            candidates = self._iter_longest_in_order(text, longest=longest)
+        found = []
+        for regex_label, m in candidates:
 
             context_start = max(0, (m.start() + m.end() - context_max_len) // 2)
             context_end = min(len(text), context_start + context_max_len)
@@ -243,70 +778,611 @@ def regex_text(text, longest=True, context_max_len=999, dayfirst=True):
             if context_end != len(text):
                 context_str = context_str[:-1] + '\u2026'  # this is the `...` character
 
-            parsed_date = None
-            try:
-                with warnings.catch_warnings():
-                    warnings.simplefilter('ignore', category=dateutil.parser.UnknownTimezoneWarning)
-
-                    if 'HH' in regex_label:
-                        if 'dd' in regex_label or 'YYYY' in regex_label:
-                            matched_text = re.sub(r'[\\]', '/', m.group())
-                            parsed_date = dateutil.parser.parse(matched_text, dayfirst=dayfirst)
-                        else:
-                            matched_text = re.sub(r'H(?:(?:OU)?RS?)?', '', m.group(), flags=re.I)
-                            matched_text = re.sub(r'MN', r'AM', matched_text, flags=re.I)
-                            matched_text = re.sub(r'NN', r'PM', matched_text, flags=re.I)
-                            matched_text = re.sub(r'(\d)[. ](\d)', r'\1:\2', matched_text)
-                            matched_text = f'2001-01-01 {matched_text}'
-                            parsed_date = dateutil.parser.parse(matched_text, dayfirst=dayfirst).time()
-                    elif 'dd' in regex_label or 'YYYY' in regex_label:
-                        matched_text = re.sub(r'[\\]', '/', m.group())
-                        parsed_date = dateutil.parser.parse(matched_text, dayfirst=dayfirst).date()
-            except ValueError:
-                pass
-
-            matches.append({'REGEX_LABEL':   regex_label,
-                            'MATCH':         m.group(),
-                            'START':         m.start(),
-                            'END':           m.end(),
-                            'MATCH_LEN':     m.end() - m.start(),
-                            'NORM_TEXT_LEN': len(text),
-                            'CONTEXT':       context_str,
-                            'PARSED':        parsed_date,
-                            })
-
-    # narrow to longest match
-    for match in matches:
-        if not longest or all((other['START'] >= match['START'] and other['END'] <= match['END']) or
-                              other['START'] > match['END'] or
-                              other['END'] < match['START']
-                              for other in matches):
+            found.append({'REGEX_LABEL':   regex_label,
+                          'MATCH':         m.group(),
+                          'START':         m.start(),
+                          'END':           m.end(),
+                          'MATCH_LEN':     m.end() - m.start(),
+                          'NORM_TEXT_LEN': len(text),
+                          'CONTEXT':       context_str,
+                          'PARSED':        None,
+                          })
+            if limit is not None and len(found) >= limit:
+                break
 
-            # don't return emails or urls
-            if match['REGEX_LABEL'] not in {u'eml', 'url', 'dot'}:
-                yield match
+        # only parse what is returned, in one batch
+        if parse:
+            parsed_values = self.parse_batch([match['REGEX_LABEL'] for match in found],
+                                             [match['MATCH'] for match in found],
+                                             dayfirst=dayfirst)
+            for match, parsed in zip(found, parsed_values):
+                match['PARSED'] = parsed
 
+        yield from found
 
-def regex_file(path, parser=parse_txt):
+    def regex_file(self, path, parser=parse_txt, limit=None, parse=True):
+        """
+        find dates and times in a file, one line at a time
+        :param path: file to read
+        :param parser: function that takes a path and returns (file_name, lines)
+        :param limit: stop after this many rows
+        :param parse: set PARSED (otherwise it is always None)
+        """
+        path = os.path.abspath(path)
+        file_name, file_lines = parser(path)  #
+        num_rows = 0
+        for line_num, line in enumerate(file_lines):
+            if limit is not None and num_rows >= limit:
+                return
+            for match_info in self.regex_text(line,
+                                              limit=None if limit is None else limit - num_rows,
+                                              parse=parse):
+                num_rows += 1
+                yield [path,
+                       file_name,
+                       match_info['REGEX_LABEL'],
+                       line_num,
+                       match_info['MATCH'],
+                       match_info['START'],
+                       match_info['END'],
+                       match_info['MATCH_LEN'],
+                       match_info['NORM_TEXT_LEN'],
+                       match_info['CONTEXT'],
+                       match_info['PARSED'],
+                       ]
+
+
+class FrozenDatetimeExtractor(DatetimeExtractor):
+    """
+    read-only DatetimeExtractor that can be shared by many threads (including on free-threaded builds)
+    nothing is compiled lazily, and the pattern dicts are read-only
+    use `get_frozen_extractor` instead of creating these directly
+    """
+
+    __slots__ = ()
+
+    def __init__(self, config):
+        """
+        :type config: ExtractorConfig
+        """
+        super(FrozenDatetimeExtractor, self).__init__(config)
+        self._regex_any = self._compile_regex_any()
+        self.regex_parts = types.MappingProxyType(self.regex_parts)
+        self.regex_formatted = types.MappingProxyType(self.regex_formatted)
+        self.regex_compiled = types.MappingProxyType(self.regex_compiled)
+        self.regex_composed = types.MappingProxyType(self.regex_composed)
+
+    def __reduce__(self):
+        return get_frozen_extractor, (self.config,)
+
+
+# compiled extractors, one per (normalized) config and class, shared by all callers (and threads) in this process
+_EXTRACTORS = dict()
+_EXTRACTORS_LOCK = threading.Lock()  # so that concurrent first calls compile each extractor only once
+
+
+def get_extractor(config=None, **kwargs):
+    """
+    get the (cached) compiled extractor for a config
+    :param config: ExtractorConfig, or None for the defaults
+    :param kwargs: ExtractorConfig fields to override, e.g. `get_extractor(year_min=1900, languages=['en'])`
+    :rtype: DatetimeExtractor
+    """
+    return _get_extractor(DatetimeExtractor, config, kwargs)
+
+
+def get_frozen_extractor(config=None, **kwargs):
+    """
+    like get_extractor, but the (cached) extractor is a FrozenDatetimeExtractor, safe to share between threads
+    :rtype: FrozenDatetimeExtractor
+    """
+    return _get_extractor(FrozenDatetimeExtractor, config, kwargs)
+
+
+def _get_extractor(extractor_class, config, kwargs):
+    if config is None:
+        config = ExtractorConfig(**kwargs)
+    elif kwargs:
+        config = config._replace(**kwargs)
+
+    # normalize so that equivalent configs share one cache entry
+    if config.dayfirst is None:
+        config = config._replace(dayfirst=ExtractorConfig._field_defaults['dayfirst'])
+    elif not isinstance(config.dayfirst, bool):
+        raise ValueError(f'dayfirst must be True, False, or None (the default), not {config.dayfirst!r}')
+    languages = tuple(sorted(set(config.languages)))
+    config = config._replace(languages=languages)
+    for lang in languages:
+        if lang not in MONTH_NAMES or lang not in DAY_NAMES:
+            raise ValueError(f'unsupported language: {lang!r}')
+    if not languages:
+        raise ValueError('at least one language is required')
+    if not 1000 <= config.year_min <= config.year_max <= 9999:
+        raise ValueError(f'invalid year window: {config.year_min} to {config.year_max}')
+
+    extractor = _EXTRACTORS.get((extractor_class, config))
+    if extractor is None:
+        with _EXTRACTORS_LOCK:
+            extractor = _EXTRACTORS.get((extractor_class, config))
+            if extractor is None:
+                extractor = _EXTRACTORS[extractor_class, config] = extractor_class(config)
+    return extractor
+
+
+def regex_text(text, longest=True, context_max_len=999, dayfirst=None, limit=None, first_only=False, parse=True,
+               config=None):
+    return get_extractor(config).regex_text(text, longest=longest, context_max_len=context_max_len, dayfirst=dayfirst,
+                                            limit=1 if first_only else limit, parse=parse)
+
+
+def regex_file(path, parser=parse_txt, limit=None, first_only=False, parse=True, config=None):
+    return get_extractor(config).regex_file(path, parser=parser, limit=1 if first_only else limit, parse=parse)
+
+
+def has_datetime(text, longest=True, config=None):
+    """
+    fast check for whether a text contains any date or time (that regex_text would return)
+    :rtype: bool
+    """
+    return get_extractor(config).has_datetime(text, longest=longest)
+
+
+def __getattr__(name):
+    # the default extractor is compiled on first use instead of at import time,
+    # so that spawned workers only pay for the config they actually use
+    if name == 'REGEX_FORMATTED':
+        return get_extractor().regex_formatted
+    if name == 'REGEX_COMPILED':
+        return get_extractor().regex_compiled
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+# the extractor used by this worker process, set by `init_worker`
+_WORKER_EXTRACTOR = None
+
+
+def init_worker(config=None):
+    """
+    multiprocessing pool initializer: builds the compiled extractor once per worker process
+    with the fork start method the extractor is already in the inherited (copy-on-write) cache, so this is ~free
+    with spawn/forkserver it is compiled once here instead of once per task
+    :param config: ExtractorConfig, or None for the defaults
+    """
+    global _WORKER_EXTRACTOR
+    _WORKER_EXTRACTOR = get_extractor(config)
+
+
+def _worker_regex_file(path):
+    extractor = _WORKER_EXTRACTOR if _WORKER_EXTRACTOR is not None else get_extractor()
+    return list(extractor.regex_file(path))
+
+
+def regex_files(paths, processes=None, config=None, start_method=None, chunksize=1):
+    """
+    run `regex_file` over many files with a process pool, yielding rows in the same order as `paths`
+    the extractor is compiled in this process before the pool starts, so forked workers inherit it
+    :param paths: iterable of file paths
+    :param processes: number of worker processes (default: cpu count)
+    :param config: ExtractorConfig, or None for the defaults
+    :param start_method: 'fork', 'spawn', 'forkserver', or None for the platform default
+    :param chunksize: number of paths sent to a worker at a time
+    """
+    get_extractor(config)  # compile before forking
+    ctx = multiprocessing.get_context(start_method)
+    with ctx.Pool(processes, initializer=init_worker, initargs=(config,)) as pool:
+        for rows in pool.imap(_worker_regex_file, paths, chunksize=chunksize):
+            yield from rows
+
+
+def regex_texts_threaded(texts, threads=None, config=None, chunksize=64, **kwargs):
+    """
+    run `regex_text` over many texts with a thread pool sharing one FrozenDatetimeExtractor,
+    yielding a list of matches per text, in the same order as `texts`
+    only scales with threads on free-threaded builds (elsewhere the GIL runs one thread at a time),
+    but unlike regex_files there is no process startup, pickling, or per-process compiling
+    :param texts: iterable of strings
+    :param threads: number of threads (default: cpu count)
+    :param config: ExtractorConfig, or None for the defaults
+    :param chunksize: number of texts per task
+    :param kwargs: passed on to regex_text (longest, context_max_len, dayfirst, limit, parse)
+    """
+    extractor = get_frozen_extractor(config)
+
+    def regex_chunk(chunk):
+        return [list(extractor.regex_text(text, **kwargs)) for text in chunk]
+
+    text_iterator = iter(texts)
+    chunks = iter(lambda: list(itertools.islice(text_iterator, chunksize)), [])  # until an empty chunk
+    for results in _threaded_map(regex_chunk, chunks, threads):
+        yield from results
+
+
+def regex_files_threaded(paths, threads=None, config=None):
+    """
+    like regex_files, but with a thread pool sharing one FrozenDatetimeExtractor (see regex_texts_threaded)
+    :param paths: iterable of file paths
+    :param threads: number of threads (default: cpu count)
+    :param config: ExtractorConfig, or None for the defaults
+    """
+    extractor = get_frozen_extractor(config)
+    for rows in _threaded_map(lambda path: list(extractor.regex_file(path)), paths, threads):
+        yield from rows
+
+
+def _threaded_map(func, items, threads=None):
+    """
+    like ThreadPoolExecutor.map, but with at most 2 tasks per thread submitted at a time,
+    so that items are only read as results are taken (instead of all up front) and few results are held at once
+    results are yielded in the same order as items
+    :param threads: number of threads (default: cpu count)
+    """
+    threads = threads or os.cpu_count()
+    with concurrent.futures.ThreadPoolExecutor(threads) as executor:
+        futures = collections.deque()
+        try:
+            for item in items:
+                if len(futures) >= 2 * threads:
+                    yield futures.popleft().result()
+                futures.append(executor.submit(func, item))
+            while futures:
+                yield futures.popleft().result()
+        finally:
+            for future in futures:  # if the caller stops early, don't run what is left
+                future.cancel()
+
+
+class MatchSink(object):
+    """
+    streaming aggregate over matches, fed one match at a time by `aggregate_file`
+    only keeps compact summary state (never the matches themselves)
+    must be picklable and mergeable, so that per-process results can be combined by `aggregate_files`
+    """
+
+    __slots__ = ()
+
+    def add(self, path, match_info):
+        raise NotImplementedError
+
+    def merge(self, other):
+        raise NotImplementedError
+
+    def summary(self):
+        raise NotImplementedError
+
+
+class LabelCounter(MatchSink):
+    """
+    number of matches per regex label
+    """
+
+    __slots__ = ('counts',)
+
+    def __init__(self):
+        self.counts = collections.Counter()
+
+    def add(self, path, match_info):
+        self.counts[match_info['REGEX_LABEL']] += 1
+
+    def merge(self, other):
+        self.counts.update(other.counts)
+        return self
+
+    def summary(self):
+        """
+        :rtype: dict[str, int]
+        """
+        return dict(self.counts.most_common())
+
+
+class MonthHistogram(MatchSink):
+    """
+    number of parsed dates per month per file (times without dates are ignored)
+    """
+
+    __slots__ = ('counts',)
+
+    def __init__(self):
+        self.counts = collections.Counter()  # {(path, year * 12 + month - 1): count}
+
+    def add(self, path, match_info):
+        parsed = match_info['PARSED']
+        if isinstance(parsed, datetime.date):
+            self.counts[path, parsed.year * 12 + parsed.month - 1] += 1
+
+    def merge(self, other):
+        self.counts.update(other.counts)
+        return self
+
+    def summary(self):
+        """
+        :return: {path: {'YYYY-MM': count}}
+        :rtype: dict[str, dict[str, int]]
+        """
+        out = dict()
+        for (path, month_index), count in sorted(self.counts.items()):
+            out.setdefault(path, dict())[f'{month_index // 12:04d}-{month_index % 12 + 1:02d}'] = count
+        return out
+
+
+class DateRange(MatchSink):
+    """
+    earliest and latest parsed date per file (datetimes are truncated to dates)
+    """
+
+    __slots__ = ('ranges',)
+
+    def __init__(self):
+        self.ranges = dict()  # {path: (min_date, max_date, count)}
+
+    def add(self, path, match_info):
+        parsed = match_info['PARSED']
+        if isinstance(parsed, datetime.datetime):
+            parsed = parsed.date()
+        elif not isinstance(parsed, datetime.date):
+            return
+        if path in self.ranges:
+            min_date, max_date, count = self.ranges[path]
+            self.ranges[path] = (min(min_date, parsed), max(max_date, parsed), count + 1)
+        else:
+            self.ranges[path] = (parsed, parsed, 1)
+
+    def merge(self, other):
+        for path, (min_date, max_date, count) in other.ranges.items():
+            if path in self.ranges:
+                self_min, self_max, self_count = self.ranges[path]
+                self.ranges[path] = (min(self_min, min_date), max(self_max, max_date), self_count + count)
+            else:
+                self.ranges[path] = (min_date, max_date, count)
+        return self
+
+    def summary(self):
+        """
+        :return: {path: (min_date, max_date, num_dates)}
+        :rtype: dict[str, (datetime.date, datetime.date, int)]
+        """
+        return dict(sorted(self.ranges.items()))
+
+
+def aggregate_file(path, sinks, parser=parse_txt, config=None):
+    """
+    feed every match in a file to each sink, without materializing rows
+    :param path: file to read
+    :param sinks: list of MatchSink
+    :param parser: same as for `regex_file`
+    :param config: ExtractorConfig, or None for the defaults
+    :return: the same sinks
+    """
+    extractor = get_extractor(config)
     path = os.path.abspath(path)
-    file_name, file_lines = parser(path)  #
-    for line_num, line in enumerate(file_lines):
-        for match_info in regex_text(line):
-            yield [path,
-                   file_name,
-                   match_info['REGEX_LABEL'],
-                   line_num,
-                   match_info['MATCH'],
-                   match_info['START'],
-                   match_info['END'],
-                   match_info['MATCH_LEN'],
-                   match_info['NORM_TEXT_LEN'],
-                   match_info['CONTEXT'],
-                   match_info['PARSED'],
-                   ]
+    file_name, file_lines = parser(path)
+    for line in file_lines:
+        for match_info in extractor.regex_text(line):
+            for sink in sinks:
+                sink.add(path, match_info)
+    return sinks
+
+
+def _worker_aggregate(args):
+    path, sink_types = args
+    extractor = _WORKER_EXTRACTOR if _WORKER_EXTRACTOR is not None else get_extractor()
+    return aggregate_file(path, [sink_type() for sink_type in sink_types], config=extractor.config)
+
+
+def aggregate_files(paths, sink_types=(LabelCounter, MonthHistogram, DateRange), processes=None, config=None,
+                    start_method=None, chunksize=1):
+    """
+    aggregate matches over many files with a process pool
+    each worker returns one small set of sinks per file, which are merged here
+    :param paths: iterable of file paths
+    :param sink_types: MatchSink subclasses (or other picklable zero-arg factories) to aggregate with
+    :param processes: number of worker processes (default: cpu count)
+    :param config: ExtractorConfig, or None for the defaults
+    :param start_method: 'fork', 'spawn', 'forkserver', or None for the platform default
+    :param chunksize: number of paths sent to a worker at a time
+    :return: one merged sink per sink type
+    :rtype: list[MatchSink]
+    """
+    sink_types = tuple(sink_types)
+    merged = [sink_type() for sink_type in sink_types]
+
+    get_extractor(config)  # compile before forking
+    ctx = multiprocessing.get_context(start_method)
+    with ctx.Pool(processes, initializer=init_worker, initargs=(config,)) as pool:
+        for sinks in pool.imap_unordered(_worker_aggregate, ((path, sink_types) for path in paths),
+                                         chunksize=chunksize):
+            for merged_sink, sink in zip(merged, sinks):
+                merged_sink.merge(sink)
+    return merged
+
+
+def sample_file(path, num_strata=16, block_size=65536, seed=0, config=None):
+    """
+    run the extractor on a stratified random sample of a file without reading all of it
+    the file is cut into `num_strata` strata of equal size, and each stratum into slots of `block_size` bytes,
+    and 2 different slots are picked at random in each stratum (so that the variance within it can be estimated)
+    each block is the lines that start in its slot (read by seeking), so blocks never overlap each other
+    files no bigger than the whole sample are read in full, as one stratum with one block (so the estimate is exact)
+    only the decoding and extracting is timed, since random reads are slower than reading the file in order
+    :param path: file to sample
+    :param num_strata: number of strata (per file)
+    :param block_size: bytes per slot (a block can run past its slot to the end of its last line)
+    :param seed: same sample for the same seed and path
+    :param config: ExtractorConfig, or None for the defaults
+    :return: [{'BYTES': stratum size, 'BLOCKS': [(block bytes, lines, seconds, {label: count})],
+               'RANGES': [(start, end) byte offsets of each block]}]
+    :rtype: list[dict]
+    """
+    extractor = get_extractor(config)
+    rng = random.Random(f'{seed}:{os.path.abspath(path)}')
+    file_size = os.path.getsize(path)
+    if file_size <= num_strata * 2 * block_size:
+        boundaries = [0, file_size]
+        slots = [[(0, file_size)]]
+    else:
+        # every stratum is at least 2 * block_size bytes, so it has at least 2 whole slots
+        boundaries = [file_size * index // num_strata for index in range(num_strata + 1)]
+        slots = [[(lo + slot * block_size, lo + (slot + 1) * block_size)
+                  for slot in sorted(rng.sample(range((hi - lo) // block_size), 2))]
+                 for lo, hi in zip(boundaries, boundaries[1:])]
+
+    strata = []
+    with io.open(path, mode='rb') as f:
+        for stratum_index, stratum_slots in enumerate(slots):
+            blocks = []
+            ranges = []
+            for slot_start, slot_end in stratum_slots:
+                # read the lines that start in the slot: from the first line start at or after slot_start,
+                # up to slot_end, and then on to the end of the last line (unless it already ends there)
+                f.seek(max(0, slot_start - 1))
+                if slot_start:
+                    f.readline()
+                block_start = f.tell()
+                data = b''
+                if block_start < slot_end:
+                    data = f.read(slot_end - block_start)
+                    if not data.endswith(b'\n'):
+                        data += f.readline()
+
+                t = time.perf_counter()
+                counts = collections.Counter()
+                lines = io.StringIO(data.decode('utf8', errors='replace'), newline=None).readlines()
+                for line in lines:
+                    for match_info in extractor.regex_text(line):
+                        counts[match_info['REGEX_LABEL']] += 1
+                blocks.append((len(data), len(lines), time.perf_counter() - t, counts))
+                ranges.append((block_start, block_start + len(data)))
+            strata.append({'BYTES':  boundaries[stratum_index + 1] - boundaries[stratum_index],
+                           'BLOCKS': blocks,
+                           'RANGES': ranges,
+                           })
+    return strata
+
+
+def _ratio_estimate(stratum_bytes, block_bytes, block_values):
+    """
+    ratio estimate of a stratum's total (value per byte of the sample, times the stratum size), and its variance
+    """
+    sampled_bytes = sum(block_bytes)
+    if not sampled_bytes:
+        return 0.0, 0.0
+    ratio = sum(block_values) / sampled_bytes
+    if sampled_bytes >= stratum_bytes or len(block_bytes) < 2:
+        return ratio * stratum_bytes, 0.0
+    num_blocks = len(block_bytes)
+    residual_variance = sum((value - ratio * size) ** 2
+                            for size, value in zip(block_bytes, block_values)) / (num_blocks - 1)
+    sampled_fraction = sampled_bytes / stratum_bytes
+    num_units = stratum_bytes * num_blocks / sampled_bytes  # number of blocks the stratum would be cut into
+    variance = num_units ** 2 * (1 - sampled_fraction) * residual_variance / num_blocks
+    return ratio * stratum_bytes, variance
+
+
+def estimate_files(paths, num_strata=16, block_size=65536, confidence=0.95, seed=0, config=None):
+    """
+    estimate how many matches per label a full `regex_files` run would find, and how long it would take,
+    from a stratified sample of each file (see sample_file)
+    each stratum is scaled up by its size in bytes, and the bounds assume the stratum totals are roughly normal,
+    so they are too narrow if matches are rare and clumped (a label never seen in the sample is not reported)
+    :param paths: iterable of file paths
+    :param num_strata: number of strata per file
+    :param block_size: bytes per sampled block
+    :param confidence: of the (lower, upper) bounds
+    :param seed: same sample for the same seed
+    :param config: ExtractorConfig, or None for the defaults
+    :return: {'FILES', 'BYTES', 'SAMPLED_BYTES', 'SAMPLED_LINES', 'SAMPLED_SECONDS', 'CONFIDENCE',
+              'MATCHES': (estimate, lower, upper), 'SECONDS': (estimate, lower, upper) for one process,
+              'LABELS': {label: (estimate, lower, upper)}}
+    :rtype: dict
+    """
+    z = statistics.NormalDist().inv_cdf((1 + confidence) / 2)
+    strata = []
+    num_files = 0
+    for path in paths:
+        strata.extend(sample_file(path, num_strata=num_strata, block_size=block_size, seed=seed, config=config))
+        num_files += 1
+    labels = sorted(set(label for stratum in strata for block in stratum['BLOCKS'] for label in block[3]))
+
+    def estimate(get_value):
+        total = 0.0
+        variance = 0.0
+        for stratum in strata:
+            stratum_total, stratum_variance = _ratio_estimate(stratum['BYTES'],
+                                                              [block[0] for block in stratum['BLOCKS']],
+                                                              [get_value(block) for block in stratum['BLOCKS']])
+            total += stratum_total
+            variance += stratum_variance
+        margin = z * math.sqrt(variance)
+        return total, max(0.0, total - margin), total + margin
+
+    return {'FILES':           num_files,
+            'BYTES':           sum(stratum['BYTES'] for stratum in strata),
+            'SAMPLED_BYTES':   sum(block[0] for stratum in strata for block in stratum['BLOCKS']),
+            'SAMPLED_LINES':   sum(block[1] for stratum in strata for block in stratum['BLOCKS']),
+            'SAMPLED_SECONDS': sum(block[2] for stratum in strata for block in stratum['BLOCKS']),
+            'CONFIDENCE':      confidence,
+            'MATCHES':         estimate(lambda block: sum(block[3].values())),
+            'SECONDS':         estimate(lambda block: block[2]),
+            'LABELS':          {label: estimate(lambda block: block[3][label]) for label in labels},
+            }
+
+
+def self_test():
+    # dayfirst=None means the default (day first), and anything else that isn't a bool is an error
+    assert get_extractor(dayfirst=None) is get_extractor()
+    assert get_extractor(dayfirst=None).config.dayfirst is True
+    assert get_extractor(dayfirst=False).config.dayfirst is False
+    try:
+        get_extractor(dayfirst=0)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('dayfirst=0 should be rejected')
+
+    # limit keeps the first matches in the text, not the first labels
+    text = 'on 14/8/1991 and 2020-01-15 10:30'
+    assert [match['MATCH'] for match in regex_text(text, limit=1)] == ['14/8/1991']
+    assert [match['MATCH'] for match in regex_text(text, first_only=True)] == ['14/8/1991']
+    assert [match['MATCH'] for match in regex_text(text, limit=2)] == ['14/8/1991', '2020-01-15 10:30']
+    assert sorted(match['MATCH'] for match in regex_text(text)) == ['14/8/1991', '2020-01-15 10:30']
+
+    # unknown timezone names are dropped without a warning, and without touching the warnings filters
+    filters = list(warnings.filters)
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        assert get_frozen_extractor().parse('HH_MZ_pp_1', '10:30 EST') == datetime.time(10, 30)
+        assert get_extractor().parse('HH_MZ_pp_1', '10:30 EST') == datetime.time(10, 30)
+    assert warnings.filters == filters
+
+    # the threaded batch APIs stream: an endless input is only read a few chunks ahead of the output
+    drawn = itertools.count()
+    texts = (f'day {next(drawn)} is 2020-01-15' for _ in itertools.count())
+    results = itertools.islice(regex_texts_threaded(texts, threads=2, chunksize=10, parse=False), 25)
+    assert [[match['MATCH'] for match in matches] for matches in results] == [['2020-01-15']] * 25
+    assert next(drawn) <= 10 * (2 * 2 + 3)
+    # sampled blocks are disjoint whole lines, including when lines end exactly on the slot boundaries
+    for lines, block_size in (([f'line {index} on 2020-01-{index % 28 + 1:02d}' + ' x' * (index % 50) + '\n'
+                                for index in range(5000)], 256),
+                              ([f'{index:02d} 2020-01-15'.ljust(63) + '\n' for index in range(12)], 64)):
+        fd, path = tempfile.mkstemp(suffix='.txt')
+        with io.open(fd, mode='w', encoding='utf8', newline='') as f:
+            f.writelines(lines)
+        try:
+            line_starts = set(itertools.accumulate((len(line) for line in lines), initial=0))
+            for seed in range(20):
+                strata = sample_file(path, num_strata=4, block_size=block_size, seed=seed)
+                ranges = sorted(block_range for stratum in strata for block_range in stratum['RANGES'])
+                assert len(ranges) == 8
+                assert all(end <= next_start for (_, end), (next_start, _) in zip(ranges, ranges[1:]))
+                assert all(start in line_starts and end in line_starts for start, end in ranges)
+                assert [block[0] for stratum in strata for block in stratum['BLOCKS']] == \
+                       [end - start for stratum in strata for start, end in stratum['RANGES']]
+        finally:
+            os.remove(path)
 
 
 if __name__ == '__main__':
+    self_test()
+
     SOURCE_FILES = ['regex_datetime_test.txt', 'README.md']
     OUTPUT_CSV = 'found.csv'
 
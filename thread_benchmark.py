@@ -0,0 +1,110 @@
+import datetime
+import io
+import json
+import os
+import platform
+import sys
+import time
+
+from find_replace import AhoCorasickReplace
+from find_replace import space_tokenize
+from find_replace import translate_texts
+from find_replace_benchmark import make_dictionary
+from find_replace_benchmark import make_text
+from regex_datetime import get_frozen_extractor
+from regex_datetime import regex_texts_threaded
+
+THREAD_COUNTS = [1, 2, 4, 8]
+
+
+def gil_enabled():
+    """
+    False only on a free-threaded build running with the GIL disabled
+    """
+    is_gil_enabled = getattr(sys, '_is_gil_enabled', None)
+    return True if is_gil_enabled is None else is_gil_enabled()
+
+
+def make_corpus(num_lines=20000, seed=0):
+    """
+    the same lines for both benchmarks: the test file's lines (lots of dates),
+    interleaved with synthetic text containing dictionary keys
+    :return: (lines, dictionary pairs)
+    """
+    with io.open('regex_datetime_test.txt', mode='r', encoding='utf8') as f:
+        date_lines = [line.strip() for line in f if line.strip()]
+    pairs = make_dictionary(10 ** 4, 'words', seed=seed)
+    filler = make_text(pairs, num_chars=num_lines * 40, seed=seed).split(' ')
+    lines = []
+    for index in range(num_lines):
+        words = filler[index * 6:index * 6 + 6]
+        lines.append('%s %s' % (' '.join(words), date_lines[index % len(date_lines)]))
+    return lines, pairs
+
+
+def benchmark_threads(lines, pairs, thread_counts=THREAD_COUNTS, verbose=True):
+    """
+    throughput of regex_texts_threaded and translate_texts on the same lines with different numbers of threads
+    everything is built before the clock starts, so only the searching is timed
+    :rtype: list[dict]
+    """
+    get_frozen_extractor()
+    trie = AhoCorasickReplace(space_tokenize).bulk_update(pairs, verbose=False).freeze()
+    num_chars = sum(len(line) for line in lines)
+
+    results = []
+    for name, run in [('regex_text', lambda threads: sum(1 for _ in regex_texts_threaded(lines, threads=threads))),
+                      ('translate', lambda threads: sum(1 for _ in translate_texts(trie, lines, threads=threads)))]:
+        base_seconds = None
+        for threads in thread_counts:
+            t = time.perf_counter()
+            run(threads)
+            seconds = time.perf_counter() - t
+            if base_seconds is None:
+                base_seconds = seconds
+            result = {'benchmark':   name,
+                      'threads':     threads,
+                      'seconds':     seconds,
+                      'lines_per_s': len(lines) / seconds,
+                      'mb_per_s':    num_chars / 1e6 / seconds,
+                      'speedup':     base_seconds / seconds,  # relative to the first thread count
+                      }
+            if verbose:
+                print('%-10s %2d threads: %8.0f lines/s, %.2fx' % (name, threads, result['lines_per_s'],
+                                                                   result['speedup']))
+            results.append(result)
+    return results
+
+
+def save_results(results, path):
+    with io.open(path, mode='w', encoding='utf8') as f:
+        json.dump({'timestamp':   datetime.datetime.now().isoformat(),
+                   'python':      sys.version,
+                   'platform':    platform.platform(),
+                   'cpu_count':   os.cpu_count(),
+                   'gil_enabled': gil_enabled(),
+                   'results':     results,
+                   }, f, indent=4)
+
+
+def compare_scaling(gil_path, free_threaded_path):
+    """
+    print the speedups from a GIL run next to those from a free-threaded run
+    """
+    runs = []
+    for path in (gil_path, free_threaded_path):
+        with io.open(path, mode='r', encoding='utf8') as f:
+            runs.append({(result['benchmark'], result['threads']): result for result in json.load(f)['results']})
+    print('%-10s %7s %12s %14s' % ('', 'threads', 'GIL speedup', 'no-GIL speedup'))
+    for key in sorted(set(runs[0]) & set(runs[1])):
+        print('%-10s %7d %11.2fx %13.2fx' % (key[0], key[1], runs[0][key]['speedup'], runs[1][key]['speedup']))
+
+
+if __name__ == '__main__':
+    # run this once with a regular build and once with a free-threaded build (e.g. python3.13t -X gil=0)
+    corpus_lines, corpus_pairs = make_corpus()
+    print('%s, gil enabled: %s' % (sys.version.split()[0], gil_enabled()))
+    benchmark_results = benchmark_threads(corpus_lines, corpus_pairs)
+    save_results(benchmark_results, 'thread_benchmark_%s.json' % ('gil' if gil_enabled() else 'nogil'))
+    if os.path.exists('thread_benchmark_gil.json') and os.path.exists('thread_benchmark_nogil.json'):
+        compare_scaling('thread_benchmark_gil.json', 'thread_benchmark_nogil.json')